@@ -1,194 +1,324 @@
-import csv
-import json
 import time
 from datetime import datetime
 import asyncio
-import aiohttp
-from bs4 import BeautifulSoup
-from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest
+from prometheus_client import Gauge, start_http_server
 import os
-from urllib.parse import urljoin
-import logging
+import argparse
+import socket
+import subprocess
+import sys
+
+from crawler import tracing
+from crawler.checkpoints import CrawlCheckpoint
+from crawler.diff import previous_snapshot_from_env
+from crawler.engine import (
+    attach_change_log,
+    crawl_once,
+    books_errors_total,
+    books_found_total,
+    books_parsed_total,
+    categories_count,
+    crawl_mode_from_env,
+    finish_change_log,
+    gather_data,
+    get_category_book_links,
+    new_base_path,
+    open_sites,
+    resolve_book,
+    scrape_duration,
+    serve,
+    snapshot_pattern,
+    time_to_first_book,
+    write_snapshots,
+)
+from crawler.extractors import selected_fields
+from crawler.politeness import BudgetExceeded, RobotsDisallowed
+from crawler.profiles import profiles_from_env
+from crawler.runtime import init_logging, write_metrics_snapshot
+from crawler.work_queue import WorkQueue
+from crawler.writers import open_book_writers
 
-# Глобальное хранилище результатов
-books_data = []
 # Время старта всего скрипта
 start_time = time.time()
 
-# --- Метрики Prometheus ---
-scrape_duration = Gauge("scrape_duration_seconds", "Общее время работы скрипта")
-categories_count = Gauge("categories_count", "Количество категорий")
-books_found_total = Gauge("books_found_total", "Количество уникальных книг")
-books_parsed_total = Counter("books_parsed_total", "Количество успешно распарсенных книг")
-books_errors_total = Counter("books_errors_total", "Количество ошибок при парсинге книг")
-http_requests_total = Counter("http_requests_total", "Количество HTTP запросов")
-http_request_errors_total = Counter("http_request_errors_total", "Количество ошибок HTTP")
-http_request_duration = Histogram("http_request_duration_seconds", "Время HTTP запросов")
-category_books_count = Gauge("category_books_count", "Книг в категории", ["category"])
-
-# --- HTTP: получить текст страницы ---
-async def fetch_text(session, url, headers):
-    start = time.time()
-    try:
-        async with session.get(url, headers=headers) as resp:
-            text = await resp.text()
-            http_requests_total.inc()
-            http_request_duration.observe(time.time() - start)
-            return text
-    except Exception:
-        http_request_errors_total.inc()
-        http_request_duration.observe(time.time() - start)
-        raise
+shard_tasks = Gauge("shard_tasks", "Задачи общей очереди шардированного обхода", ["status"])
+
+# Имена снимков в data/async ({ts} — время запуска)
+SNAPSHOT_NAME = "labirint_{ts}_async"
 
-# --- Блок: получить ссылки книг из одной категории ---
-async def get_category_book_links(session, name, url, base_url, headers, logger):
-    book_urls = []
-    page_url = url
-    base_catalogue = base_url + "catalogue/"
+# --- Шардированный режим: координатор находит книги, воркеры разбирают их через общую очередь ---
+def share_politeness(fetcher, work_queue):
+    # Бюджет обхода — общий для координатора и воркеров, темп хоста — на всех поровну
+    fetcher.politeness.share(work_queue, int(work_queue.get_meta("processes", "1")))
 
+
+async def discover_books(profile, logger, work_queue):
+    # Координатор скачивает только главную и страницы категорий; ссылки сразу уходят в очередь,
+    # воркеры начинают разбирать книги, не дожидаясь конца обхода категорий.
+    # -> (число категорий, сколько из них не дообойдено из-за бюджета или robots.txt)
+    incomplete = 0
+    async with open_sites([profile], logger) as sites:
+        _, _, fetcher, parse_stage = sites[0]
+        share_politeness(fetcher, work_queue)
+        page = await fetcher.fetch(profile.base_url)
+        categories = await parse_stage.run_cached(
+            fetcher.cache, profile.base_url, "home", "parse_categories", page, profile.base_url
+        )
+        categories_count.labels(site=profile.name).set(len(categories))
+
+        async def enqueue_book(book_url, summary):
+            work_queue.add_task(book_url, summary)
+
+        async def crawl_category(name, url):
+            nonlocal incomplete
+            try:
+                await get_category_book_links(fetcher, name, url, logger, parse_stage, enqueue_book)
+            except (BudgetExceeded, RobotsDisallowed) as e:
+                logger.info("Категория '%s' не дообойдена: %s", name, e.reason)
+                incomplete += 1
+
+        await asyncio.gather(*(crawl_category(name, url) for name, url in categories))
+    work_queue.finish_discovery()
+    return len(categories), incomplete
+
+
+def spawn_workers(count, queue_path, metrics_port, profile=False):
+    # Каждый воркер — отдельный процесс со своим портом /metrics: PROM_PORT + 1 + номер
+    procs = []
+    for worker_id in range(count):
+        env = dict(os.environ, PROM_PORT=str(metrics_port + 1 + worker_id))
+        cmd = [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            "--queue",
+            queue_path,
+            "--worker-id",
+            str(worker_id),
+        ]
+        if profile:
+            cmd.append("--profile")
+        procs.append(subprocess.Popen(cmd, env=env))
+    return procs
+
+
+def wait_for_queue(work_queue, procs, logger):
+    poll = float(os.getenv("SHARD_POLL_SECONDS", "0.5"))
+    progress_every = float(os.getenv("SHARD_PROGRESS_SECONDS", "10"))
+    last_progress = time.monotonic()
     while True:
-        text = await fetch_text(session, page_url, headers)
-        soup = BeautifulSoup(text, "html.parser")
-        links = [a["href"] for a in soup.select("article.product_pod h3 a")]
-        for rel in links:
-            book_urls.append(base_catalogue + rel.replace("../../../", ""))
-
-        next_link = soup.select_one("li.next a")
-        if not next_link:
-            break
-        page_url = urljoin(page_url, next_link.get("href"))
-
-    logger.info("Категория '%s': %d книг", name, len(book_urls))
-    category_books_count.labels(category=name).set(len(book_urls))
-    return book_urls
-
-# --- Блок: получить данные одной книги ---
-async def get_book_data(session, book_url, headers):
-    # Скачиваем HTML книги
-    text = await fetch_text(session, book_url, headers)
-    soup = BeautifulSoup(text, "html.parser")
-
-    # Извлекаем таблицу Product Information
-    info = {}
-    for row in soup.select("table.table.table-striped tr"):
-        key = row.find("th").get_text(strip=True)
-        val = row.find("td").get_text(strip=True)
-        info[key] = val
-
-    # Название и категория книги
-    title = soup.select_one("div.product_main h1").get_text(strip=True)
-    category = soup.select("ul.breadcrumb li a")[-1].get_text(strip=True)
-
-    # Возвращаем словарь с нужными полями
-    return {
-        "title": title,
-        "category": category,
-        "upc": info.get("UPC"),
-        "product_type": info.get("Product Type"),
-        "price_excl_tax": info.get("Price (excl. tax)"),
-        "price_inc_tax": info.get("Price (incl. tax)"),
-        "tax": info.get("Tax"),
-        "availability": info.get("Availability"),
-        "num_reviews": info.get("Number of reviews"),
-    }
+        counts = work_queue.counts()
+        for status, count in counts.items():
+            shard_tasks.labels(status=status).set(count)
+        if work_queue.finished():
+            return counts
+        if all(p.poll() is not None for p in procs):
+            raise RuntimeError(f"Все воркеры завершились, задачи остались: {counts}")
+        if time.monotonic() - last_progress >= progress_every:
+            last_progress = time.monotonic()
+            logger.info(
+                "Очередь: ждут %d, в работе %d, готово %d, ошибок %d",
+                counts["pending"],
+                counts["leased"],
+                counts["done"],
+                counts["failed"],
+            )
+        time.sleep(poll)
 
-# --- Блок: обработка страницы каталога (если понадобится) ---
-async def get_page_data(session, page, base_url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
-    }
 
-    url = f"{base_url}catalogue/page-{page}.html"
-    text = await fetch_text(session, url, headers)
-    soup = BeautifulSoup(text, "html.parser")
-    # Здесь можно добавить логику для обработки данных страницы
+def run_coordinator(site, logger, workers_count, metrics_port, output_dir, fields, profile=False):
+    # site — профиль сайта (crawler.profiles), profile — профилирование запуска (--profile)
+    cur_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_path = new_base_path(output_dir, SNAPSHOT_NAME, cur_time)
+    queue_path = os.getenv("SHARD_QUEUE_PATH", os.path.join(output_dir, f"queue_{cur_time}.sqlite3"))
+    work_queue = WorkQueue(queue_path)
+    # Процессов обхода — воркеры и сам координатор: на них делится темп запросов к хосту
+    work_queue.set_meta("processes", workers_count + 1)
+    logger.info("Шардированный обход: воркеров %d, очередь %s", workers_count, queue_path)
+
+    procs = spawn_workers(workers_count, queue_path, metrics_port, profile)
+    try:
+        t_start = time.time()
+        categories, incomplete = asyncio.run(discover_books(site, logger, work_queue))
+        logger.info(
+            "Категории обработаны за %.2f сек, задач в очереди: %d",
+            time.time() - t_start,
+            sum(work_queue.counts().values()),
+        )
+        counts = wait_for_queue(work_queue, procs, logger)
+        logger.info("Книги обработаны за %.2f сек", time.time() - t_start)
+    except BaseException:
+        for p in procs:
+            p.terminate()
+        raise
 
-# --- Главная асинхронная функция ---
-async def gather_data(base_url, logger):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
+    stats = {
+        "categories": categories,
+        "books_found": sum(counts.values()),
+        "books_parsed": counts["done"],
+        "books_errors": counts["failed"],
+        "books_skipped": counts["pending"],
+        "categories_incomplete": incomplete,
+        "budget_exhausted": work_queue.budget_exhausted(),
     }
+    if stats["budget_exhausted"]:
+        # Оставшиеся задачи лежат в очереди pending; --resume с --workers не сочетается
+        logger.info(
+            "Бюджет обхода исчерпан (%s): книг не обработано %d",
+            stats["budget_exhausted"],
+            stats["books_skipped"],
+        )
 
-    # Создаем сессию aiohttp
-    async with aiohttp.ClientSession() as session:
-        # 1) Скачиваем главную страницу
-        text = await fetch_text(session, base_url, headers)
-        soup = BeautifulSoup(text, "html.parser")
-
-        # 2) Собираем категории
-        categories = []
-        cat_list = soup.select_one(".side_categories ul.nav.nav-list")
-        for a in cat_list.select("li ul li a"):
-            name = a.get_text(strip=True)
-            url = base_url + a.get("href")
-            categories.append((name, url))
-        categories_count.set(len(categories))
-
-        # 3) Получаем ссылки на книги из всех категорий
-        t_cat = time.time()
-        category_tasks = [
-            get_category_book_links(session, name, url, base_url, headers, logger)
-            for name, url in categories
-        ]
-        category_results = await asyncio.gather(*category_tasks)
-        logger.info("Категории обработаны за %.2f сек", time.time() - t_cat)
-
-        # 4) Убираем дубли ссылок на книги
-        seen = set()
-        book_urls = []
-        for urls in category_results:
-            for u in urls:
-                if u not in seen:
-                    seen.add(u)
-                    book_urls.append(u)
-        books_found_total.set(len(book_urls))
-
-        # 5) Парсим книги (ограничим одновременные запросы)
-        t_books = time.time()
-        max_concurrency = int(os.getenv("MAX_CONCURRENCY", "10"))
-        sem = asyncio.Semaphore(max_concurrency)
-
-        async def bounded_get(book_url):
-            async with sem:
-                return await get_book_data(session, book_url, headers)
-
-        book_tasks = [asyncio.create_task(bounded_get(u)) for u in book_urls]
-        errors_count = 0
-        processed_count = 0
-        progress_step = int(os.getenv("LOG_PROGRESS_EVERY", "50"))
-        log_each_book = os.getenv("LOG_EACH_BOOK", "1") != "0"
-        for task in asyncio.as_completed(book_tasks):
-            try:
-                item = await task
-            except Exception as e:
-                logger.info("Ошибка при обработке книги: %s", e)
-                books_errors_total.inc()
-                errors_count += 1
-            else:
-                books_data.append(item)
-                if log_each_book:
-                    logger.info("Обработана книга: %s", item["title"])
-                books_parsed_total.inc()
-            processed_count += 1
-            if progress_step > 0 and processed_count % progress_step == 0:
-                logger.info(
-                    "Прогресс: %d/%d книг обработано",
-                    processed_count,
-                    len(book_urls),
-                )
-
-        logger.info("Книги обработаны за %.2f сек", time.time() - t_books)
-        return {
-            "categories": len(categories),
-            "books_found": len(book_urls),
-            "books_parsed": len(books_data),
-            "books_errors": errors_count,
-        }
+    # Слияние: записи воркеров лежат в очереди, в файлы их пишет только координатор.
+    # Он же единственный пишет индекс гибридного режима — воркеры его только читают
+    previous_path = previous_snapshot_from_env(output_dir, snapshot_pattern(SNAPSHOT_NAME), exclude=base_path)
+    _, listing_index = crawl_mode_from_env(logger, fields, site.name)
+    with open_book_writers(base_path, fields) as writer:
+        change_log = attach_change_log(writer, base_path, previous_path, fields, logger, site.name)
+        for url, summary, record in work_queue.results():
+            writer.write(record.to_dict(fields))
+            if listing_index is not None and summary is not None:
+                listing_index.store(url, summary, record)
+        if change_log is not None:
+            finish_change_log(writer, change_log, base_path, logger, stats)
+        logger.info("Результаты записаны в: %s", ", ".join(writer.paths))
+    if listing_index is not None:
+        listing_index.close()
+    work_queue.close()
+    books_found_total.labels(site=site.name).set(stats["books_found"])
+    return procs, base_path, stats
+
+
+async def run_worker(worker_id, logger, work_queue, fields, profile):
+    # Владелец аренды уникален и для воркеров, запущенных вручную на других машинах
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    batch_size = int(os.getenv("SHARD_BATCH", "50"))
+    poll = float(os.getenv("SHARD_POLL_SECONDS", "0.5"))
+    crawl_mode, listing_index = crawl_mode_from_env(logger, fields, profile.name, read_only=True)
+    stats = {"parsed": 0, "errors": 0, "skipped": 0}
+    results = []
+    released = []
+
+    async with open_sites([profile], logger) as sites:
+        _, _, fetcher, parse_stage = sites[0]
+        share_politeness(fetcher, work_queue)
+        t_start = time.time()
+        local = asyncio.Queue()
+
+        async def feeder():
+            # Берем задачи пачками, пока локальная очередь не наполнится; готовые
+            # результаты отдаем в общую очередь на каждом проходе
+            while True:
+                if results:
+                    work_queue.complete(owner, results[:])
+                    results.clear()
+                if released:
+                    work_queue.release(owner, released[:])
+                    released.clear()
+                claimed = []
+                # После исчерпания общего бюджета новые задачи не берем
+                if local.qsize() < batch_size and work_queue.budget_exhausted() is None:
+                    claimed = work_queue.claim(owner, batch_size)
+                    for entry in claimed:
+                        local.put_nowait(entry)
+                if claimed:
+                    continue
+                if local.empty() and work_queue.finished():
+                    return
+                await asyncio.sleep(poll)
+
+        async def book_worker():
+            while True:
+                entry = await local.get()
+                if entry is None:
+                    return
+                book_url, summary = entry
+                try:
+                    item = await resolve_book(
+                        fetcher, parse_stage, book_url, summary, crawl_mode, listing_index
+                    )
+                except BudgetExceeded:
+                    # Не ошибка: задача возвращается в очередь необработанной
+                    stats["skipped"] += 1
+                    released.append(book_url)
+                except Exception as e:
+                    logger.info("Ошибка при обработке книги: %s", e, extra={"url": book_url})
+                    books_errors_total.labels(site=profile.name).inc()
+                    stats["errors"] += 1
+                    results.append((book_url, None, str(e)))
+                else:
+                    if stats["parsed"] == 0:
+                        time_to_first_book.labels(site=profile.name).set(time.time() - t_start)
+                    books_parsed_total.labels(site=profile.name).inc()
+                    stats["parsed"] += 1
+                    results.append((book_url, item, None))
+
+        workers_count = int(os.getenv("BOOK_WORKERS", str(fetcher.limiter.max_limit)))
+        workers = [asyncio.create_task(book_worker()) for _ in range(workers_count)]
+        try:
+            await feeder()
+            for _ in workers:
+                local.put_nowait(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if listing_index is not None:
+                listing_index.close()
+
+    logger.info(
+        "Воркер %s: распарсено %d, ошибок %d, пропущено по бюджету %d, время %.2f сек",
+        worker_id,
+        stats["parsed"],
+        stats["errors"],
+        stats["skipped"],
+        time.time() - t_start,
+    )
+    return stats
 
 # --- Точка входа ---
 def main():
     # print(f"Дата и время начала: {time.time()}")
-    base_url = "https://books.toscrape.com/"
+    parser = argparse.ArgumentParser(description="Асинхронный парсер books.toscrape.com")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить прерванный запуск по чекпойнту (CHECKPOINT_PATH)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("SHARD_WORKERS", "0")),
+        help="шардированный обход: число процессов-воркеров (0 — один процесс)",
+    )
+    parser.add_argument("--worker", action="store_true", help="запустить процесс как воркер очереди")
+    parser.add_argument("--queue", help="путь к очереди задач воркера (SQLite)")
+    parser.add_argument("--worker-id", default="0", help="номер воркера для логов и снимка метрик")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="профиль запуска в папку Profiles: cProfile (.prof) и свернутые стеки (.folded)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="режим сервиса: обход каждые SERVE_INTERVAL_SECONDS и по POST /trigger на SERVE_PORT",
+    )
+    args = parser.parse_args()
+    if args.worker:
+        if not args.queue:
+            parser.error("--worker требует --queue")
+        worker_main(args.queue, args.worker_id, args.profile)
+        return
+    if args.workers > 0 and args.resume:
+        parser.error("--resume не поддерживается вместе с --workers: очередь сама переживает падение воркеров")
+    if args.serve and (args.workers > 0 or args.resume):
+        parser.error("--serve работает в одном процессе и без --resume: каждый цикл — новый обход")
+    # Сайты и их селекторы — профили из SITE_PROFILES (по умолчанию books.toscrape.com)
+    profiles = profiles_from_env()
+    if len(profiles) > 1 and (args.workers > 0 or args.resume):
+        parser.error("несколько сайтов в SITE_PROFILES обходятся без --workers и --resume")
+    site = profiles[0]
     output_dir = os.path.join("data", "async")
     os.makedirs(output_dir, exist_ok=True)
     logger, log_path, run_number = init_logging("async_parser")
@@ -197,50 +327,78 @@ def main():
     metrics_port = int(os.getenv("PROM_PORT", "8000"))
     metrics_ttl = int(os.getenv("METRICS_TTL_SECONDS", "3600"))
     start_http_server(metrics_port)
-    stats = asyncio.run(gather_data(base_url, logger))
-
-    # Сохраняем JSON
-    cur_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-    json_path = os.path.join(output_dir, f"labirint_{cur_time}_async.json")
-    with open(json_path, "w") as file:
-        json.dump(books_data, file, indent=4, ensure_ascii=False)
-
-    # Сохраняем CSV
-    csv_path = os.path.join(output_dir, f"labirint_{cur_time}_async.csv")
-    with open(csv_path, "w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file)
-        writer.writerow(
-            (
-                "title",
-                "category",
-                "upc",
-                "product_type",
-                "price_excl_tax",
-                "price_inc_tax",
-                "tax",
-                "availability",
-                "num_reviews"
-            )
+    fields = selected_fields()
+
+    profiler = tracing.RunProfiler("async_parser", run_number, enabled=args.profile).start()
+    if args.serve:
+        # Процесс живет, пока его не остановят (SIGTERM/SIGINT): /metrics доступен все время,
+        # поэтому METRICS_TTL_SECONDS здесь не нужен
+        asyncio.run(serve(profiles, logger, output_dir, SNAPSHOT_NAME, fields))
+        for path in profiler.stop():
+            logger.info("Профиль сохранен: %s", path)
+        metrics_path = write_metrics_snapshot("async_parser", run_number)
+        logger.info("Снимок метрик сохранен: %s", metrics_path)
+        return
+    procs = []
+    base_paths = []
+    if len(profiles) > 1:
+        # Несколько сайтов — одновременно в одном цикле событий, каждый в свою подпапку
+        stats = asyncio.run(crawl_once(profiles, logger, output_dir, SNAPSHOT_NAME, fields))
+    elif args.workers > 0:
+        procs, base_path, stats = run_coordinator(
+            site, logger, args.workers, metrics_port, output_dir, fields, args.profile
         )
-        for book in books_data:
-            writer.writerow(
-                (
-                    book["title"],
-                    book["category"],
-                    book["upc"],
-                    book["product_type"],
-                    book["price_excl_tax"],
-                    book["price_inc_tax"],
-                    book["tax"],
-                    book["availability"],
-                    book["num_reviews"]
-                )
+        base_paths.append(base_path)
+    else:
+        # Чекпойнт: фронтир категорий/книг и отметки о готовности для --resume
+        checkpoint = CrawlCheckpoint(
+            os.getenv("CHECKPOINT_PATH", os.path.join(output_dir, "checkpoint.sqlite3"))
+        )
+        resume = args.resume and checkpoint.can_resume()
+        if resume:
+            base_path = checkpoint.get_meta("output_base")
+            previous_path = checkpoint.get_meta("diff_previous") or None
+            logger.info("Продолжаем прерванный запуск: %s", base_path)
+        else:
+            if args.resume:
+                logger.info("Нечего продолжать: чекпойнт пуст или прошлый запуск завершен")
+            # Файлы результатов открываются до обхода и пополняются по мере разбора книг
+            base_path = new_base_path(output_dir, SNAPSHOT_NAME)
+            # Снимок для сравнения выбирается один раз и переживает --resume
+            previous_path = previous_snapshot_from_env(output_dir, snapshot_pattern(SNAPSHOT_NAME), exclude=base_path)
+            checkpoint.reset(
+                output_base=base_path, base_url=site.base_url, diff_previous=previous_path or ""
+            )
+
+        offsets = checkpoint.offsets() if resume else None
+        with open_book_writers(base_path, fields, offsets) as writer:
+            change_log = attach_change_log(
+                writer, base_path, previous_path, fields, logger, site.name, offsets
             )
+            # Отметки о готовых книгах фиксируются только после сброса их записей на диск
+            writer.on_flush(checkpoint.commit)
+            logger.info("Результаты пишутся в: %s", ", ".join(writer.paths))
+            stats = asyncio.run(gather_data(site, logger, writer, checkpoint, fields))
+            if change_log is not None:
+                finish_change_log(writer, change_log, base_path, logger, stats)
+        if stats["budget_exhausted"]:
+            # Незавершенные категории и книги остаются в чекпойнте для следующего --resume
+            logger.info("Обход остановлен бюджетом: продолжить можно с --resume")
+        else:
+            checkpoint.mark_finished()
+        checkpoint.close()
+        base_paths.append(base_path)
+    for path in profiler.stop():
+        logger.info("Профиль сохранен: %s", path)
+
+    # Обход нескольких сайтов собирает итоговые снимки сам (crawl_to_snapshot)
+    for base_path in base_paths:
+        write_snapshots(base_path, fields, logger)
 
     # Лог времени
     finish_time = time.time() - start_time
     scrape_duration.set(finish_time)
-    logger.info("Дата и время окончания: %s", cur_time)
+    logger.info("Дата и время окончания: %s", datetime.now().strftime("%Y%m%d_%H%M%S"))
     logger.info("Время выполнения скрипта: %.2f секунд", finish_time)
     if stats:
         logger.info(
@@ -256,50 +414,30 @@ def main():
     if metrics_ttl > 0:
         logger.info("Метрики будут доступны еще %d секунд", metrics_ttl)
         time.sleep(metrics_ttl)
+    for p in procs:
+        p.wait()
 
 
-def init_logging(run_label):
-    logs_dir = os.path.join(os.path.dirname(__file__), "Logs")
-    os.makedirs(logs_dir, exist_ok=True)
+def worker_main(queue_path, worker_id, profile=False):
+    logger, log_path, run_number = init_logging(f"async_worker{worker_id}")
+    logger.info("Воркер %s. Лог: %s, очередь: %s", worker_id, log_path, queue_path)
+    metrics_port = int(os.getenv("PROM_PORT", "8001"))
+    metrics_ttl = int(os.getenv("METRICS_TTL_SECONDS", "3600"))
+    start_http_server(metrics_port)
 
-    counter_path = os.path.join(logs_dir, f"{run_label}.run_counter")
+    # Аренда задач: если воркер упал, его задачи через SHARD_LEASE_SECONDS заберут другие
+    work_queue = WorkQueue(queue_path, lease_seconds=float(os.getenv("SHARD_LEASE_SECONDS", "120")))
     try:
-        with open(counter_path, "r", encoding="utf-8") as f:
-            run_number = int(f.read().strip())
-    except Exception:
-        run_number = 0
-    run_number += 1
-    with open(counter_path, "w", encoding="utf-8") as f:
-        f.write(str(run_number))
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f"{run_label}_{timestamp}_run{run_number}.log"
-    log_path = os.path.join(logs_dir, log_filename)
-
-    logger = logging.getLogger(run_label)
-    logger.setLevel(logging.INFO)
-    logger.handlers = []
-
-    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-    file_handler = logging.FileHandler(log_path, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    return logger, log_path, run_number
-
-
-def write_metrics_snapshot(run_label, run_number):
-    metrics_dir = os.path.join(os.path.dirname(__file__), "Metrics")
-    os.makedirs(metrics_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    metrics_filename = f"{run_label}_{timestamp}_run{run_number}.prom"
-    metrics_path = os.path.join(metrics_dir, metrics_filename)
-    with open(metrics_path, "wb") as f:
-        f.write(generate_latest())
-    return metrics_path
+        with tracing.RunProfiler(f"async_worker{worker_id}", run_number, enabled=profile) as profiler:
+            asyncio.run(run_worker(worker_id, logger, work_queue, selected_fields(), profiles_from_env()[0]))
+    finally:
+        work_queue.close()
+    for path in profiler.paths:
+        logger.info("Профиль сохранен: %s", path)
+    metrics_path = write_metrics_snapshot(f"async_worker{worker_id}", run_number)
+    logger.info("Снимок метрик сохранен: %s", metrics_path)
+    if metrics_ttl > 0:
+        time.sleep(metrics_ttl)
 
 
 if __name__ == "__main__":
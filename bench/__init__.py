@@ -0,0 +1 @@
+# Офлайн-бенчмарк парсеров на локальном зеркале books.toscrape.com
@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import hashlib
+import html
+import random
+import time
+
+from aiohttp import web
+
+PAGE_SIZE = 20
+RATINGS = ("One", "Two", "Three", "Four", "Five")
+WORDS = (
+    "light", "attic", "sharp", "objects", "dark", "wood", "murder", "secret", "garden",
+    "river", "night", "city", "stone", "glass", "summer", "winter", "shadow", "king",
+    "queen", "ghost", "letters", "ocean", "storm", "journey", "silent", "golden",
+)
+
+# --- Синтетический каталог: та же разметка, что у books.toscrape.com ---
+class Catalog:
+    def __init__(self, categories=50, books_per_category=20, seed=42, drift=0.0):
+        rng = random.Random(seed)
+        self.categories = []
+        self.books = {}
+        book_id = 1
+        for cat_index in range(categories):
+            name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {cat_index + 1}"
+            cat_id = cat_index + 2
+            slug = f"{name.lower().replace(' ', '-')}_{cat_id}"
+            book_ids = []
+            for _ in range(books_per_category):
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))).title()
+                if rng.random() < 0.2:
+                    title += f" ({rng.choice(WORDS).title()} #{rng.randint(1, 9)})"
+                price = f"£{rng.randint(10, 59)}.{rng.randint(0, 99):02d}"
+                self.books[book_id] = {
+                    "id": book_id,
+                    "slug": f"{'-'.join(title.lower().replace('(', '').replace(')', '').replace('#', '').split())}_{book_id}",
+                    "title": title,
+                    "category": name,
+                    "category_slug": slug,
+                    "upc": hashlib.md5(f"{seed}-{book_id}".encode()).hexdigest()[:16],
+                    "price": price,
+                    "stock": rng.randint(0, 22),
+                    "reviews": rng.randint(0, 5),
+                    "rating": rng.choice(RATINGS),
+                }
+                book_ids.append(book_id)
+                book_id += 1
+            self.categories.append({"name": name, "slug": slug, "books": book_ids})
+        # drift — доля книг с другой ценой/наличием/отзывами: «следующий день» того же каталога
+        drift_rng = random.Random(seed + 1)
+        for book in self.books.values():
+            if drift_rng.random() < drift:
+                book["price"] = f"£{drift_rng.randint(10, 59)}.{drift_rng.randint(0, 99):02d}"
+                book["stock"] = drift_rng.randint(0, 22)
+                book["reviews"] = drift_rng.randint(0, 5)
+        self.by_slug = {c["slug"]: c for c in self.categories}
+        self.books_by_slug = {b["slug"]: b for b in self.books.values()}
+
+
+def page(title, body):
+    return f"""<!DOCTYPE html>
+<html lang="en-us" class="no-js">
+    <head>
+        <title>
+    {html.escape(title)} | Books to Scrape - Sandbox
+</title>
+        <meta http-equiv="content-type" content="text/html; charset=UTF-8" />
+    </head>
+    <body id="default" class="default">
+        <div class="container-fluid page">
+            <div class="page_inner">
+{body}
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+
+def render_home(catalog):
+    links = "".join(
+        f"""
+                                        <li>
+                                            <a href="catalogue/category/books/{c['slug']}/index.html">
+                                                {html.escape(c['name'])}
+                                            </a>
+                                        </li>"""
+        for c in catalog.categories
+    )
+    return page("All products", f"""
+                <div class="side_categories">
+                    <ul class="nav nav-list">
+                        <li>
+                            <a href="catalogue/category/books_1/index.html">
+                                Books
+                            </a>
+                            <ul>{links}
+                            </ul>
+                        </li>
+                    </ul>
+                </div>""")
+
+
+def render_category(catalog, category, page_number):
+    book_ids = category["books"]
+    pages = max(1, (len(book_ids) + PAGE_SIZE - 1) // PAGE_SIZE)
+    chunk = book_ids[(page_number - 1) * PAGE_SIZE: page_number * PAGE_SIZE]
+    pods = []
+    for book_id in chunk:
+        b = catalog.books[book_id]
+        title = html.escape(b["title"])
+        short = title if len(title) <= 30 else title[:27] + "..."
+        availability = "In stock" if b["stock"] else "Out of stock"
+        pods.append(f"""
+                    <li class="col-xs-6 col-sm-4 col-md-3 col-lg-3">
+                        <article class="product_pod">
+                            <div class="image_container">
+                                <a href="../../../{b['slug']}/index.html"><img src="../../../../media/cache/{b['upc'][:2]}/{b['upc'][2:4]}/{b['upc']}.jpg" alt="{title}" class="thumbnail"></a>
+                            </div>
+                            <p class="star-rating {b['rating']}">
+                                <i class="icon-star"></i>
+                            </p>
+                            <h3><a href="../../../{b['slug']}/index.html" title="{title}">{short}</a></h3>
+                            <div class="product_price">
+                                <p class="price_color">{b['price']}</p>
+                                <p class="instock availability">
+    <i class="icon-ok"></i>
+
+        {availability}
+
+</p>
+                            </div>
+                        </article>
+                    </li>""")
+    pager = [f"""
+                        <li class="current">
+                            Page {page_number} of {pages}
+                        </li>"""]
+    if page_number > 1:
+        pager.insert(0, f'\n                        <li class="previous"><a href="page-{page_number - 1}.html">previous</a></li>')
+    if page_number < pages:
+        pager.append(f'\n                        <li class="next"><a href="page-{page_number + 1}.html">next</a></li>')
+    return page(category["name"], f"""
+            <section>
+                <ol class="row">{''.join(pods)}
+                </ol>
+                <div>
+                    <ul class="pager">{''.join(pager)}
+                    </ul>
+                </div>
+            </section>""")
+
+
+def render_book(book):
+    title = html.escape(book["title"])
+    availability = f"In stock ({book['stock']} available)" if book["stock"] else "Out of stock"
+    rows = (
+        ("UPC", book["upc"]),
+        ("Product Type", "Books"),
+        ("Price (excl. tax)", book["price"]),
+        ("Price (incl. tax)", book["price"]),
+        ("Tax", "£0.00"),
+        ("Availability", availability),
+        ("Number of reviews", str(book["reviews"])),
+    )
+    table = "".join(
+        f"""
+        <tr>
+            <th>{key}</th><td>{value}</td>
+        </tr>"""
+        for key, value in rows
+    )
+    return page(book["title"], f"""
+<ul class="breadcrumb">
+    <li>
+        <a href="../../index.html">Home</a>
+    </li>
+    <li>
+        <a href="../category/books_1/index.html">Books</a>
+    </li>
+    <li>
+        <a href="../category/books/{book['category_slug']}/index.html">{html.escape(book['category'])}</a>
+    </li>
+    <li class="active">{title}</li>
+</ul>
+<article class="product_page"><!-- Start of product page -->
+    <div class="row">
+        <div class="col-sm-6 product_main">
+            <h1>{title}</h1>
+<p class="price_color">{book['price']}</p>
+<p class="instock availability">
+    <i class="icon-ok"></i>
+        {availability}
+</p>
+            <p class="star-rating {book['rating']}">
+                <i class="icon-star"></i>
+            </p>
+        </div><!-- /col-sm-6 -->
+    </div><!-- /row -->
+    <div class="sub-header">
+        <h2>Product Information</h2>
+    </div>
+<table class="table table-striped">{table}
+</table>
+</article><!-- End of product page -->""")
+
+def render_robots(crawl_delay=0.0, disallow=()):
+    lines = ["User-agent: *"]
+    lines.extend(f"Disallow: {path}" for path in disallow)
+    if crawl_delay:
+        lines.append(f"Crawl-delay: {crawl_delay:g}")
+    return "\n".join(lines) + "\n"
+
+# --- aiohttp-приложение: задержка, ошибки 503 и ETag/304 как у настоящего сервера ---
+def create_app(
+    catalog,
+    latency=0.0,
+    latency_jitter=0.0,
+    error_rate=0.0,
+    seed=42,
+    rate_limit=0.0,
+    crawl_delay=0.0,
+    disallow=(),
+    compress=False,
+):
+    rng = random.Random(seed)
+    # Ограничение темпа как у зеркал с защитой: сверх rate_limit запросов/сек — 429
+    throttle = {"tokens": rate_limit, "last": time.monotonic()}
+
+    def throttled():
+        if not rate_limit:
+            return False
+        now = time.monotonic()
+        throttle["tokens"] = min(rate_limit, throttle["tokens"] + (now - throttle["last"]) * rate_limit)
+        throttle["last"] = now
+        if throttle["tokens"] < 1:
+            return True
+        throttle["tokens"] -= 1
+        return False
+
+    @web.middleware
+    async def behaviour(request, handler):
+        if request.path == "/robots.txt":
+            return await handler(request)
+        delay = latency + rng.uniform(-latency_jitter, latency_jitter) if latency else 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if throttled():
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+        if error_rate and rng.random() < error_rate:
+            return web.Response(status=503, text="Service Unavailable")
+        resp = await handler(request)
+        etag = '"%s"' % hashlib.md5(resp.body).hexdigest()
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        resp.headers["ETag"] = etag
+        return resp
+
+    def respond(text):
+        resp = web.Response(text=text, content_type="text/html", charset="utf-8")
+        if compress:
+            # Сжатие по Accept-Encoding клиента (gzip/deflate, br — если установлен brotli)
+            resp.enable_compression()
+        return resp
+
+    async def home(request):
+        return respond(render_home(catalog))
+
+    async def category(request):
+        cat = catalog.by_slug.get(request.match_info["slug"])
+        page_number = int(request.match_info.get("page", 1))
+        if cat is None or (page_number - 1) * PAGE_SIZE >= max(len(cat["books"]), 1):
+            raise web.HTTPNotFound()
+        return respond(render_category(catalog, cat, page_number))
+
+    async def book(request):
+        b = catalog.books_by_slug.get(request.match_info["slug"])
+        if b is None:
+            raise web.HTTPNotFound()
+        return respond(render_book(b))
+
+    async def robots(request):
+        if not crawl_delay and not disallow:
+            raise web.HTTPNotFound()
+        return web.Response(text=render_robots(crawl_delay, disallow))
+
+    app = web.Application(middlewares=[behaviour])
+    app.router.add_get("/robots.txt", robots)
+    app.router.add_get("/", home)
+    app.router.add_get("/index.html", home)
+    app.router.add_get("/catalogue/category/books/{slug}/index.html", category)
+    app.router.add_get("/catalogue/category/books/{slug}/page-{page:\\d+}.html", category)
+    app.router.add_get("/catalogue/{slug}/index.html", book)
+    return app
+
+
+def add_catalog_arguments(parser):
+    parser.add_argument("--categories", type=int, default=50, help="число категорий")
+    parser.add_argument("--books-per-category", type=int, default=20, help="книг в категории")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="разброс задержки, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--seed", type=int, default=42, help="seed генератора каталога")
+    parser.add_argument(
+        "--drift", type=float, default=0.0, help="доля книг с измененными ценой и наличием"
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, default=0.0, help="запросов в секунду, сверх — ответ 429 (0 — без ограничения)"
+    )
+    parser.add_argument("--crawl-delay", type=float, default=0.0, help="Crawl-delay в robots.txt, сек")
+    parser.add_argument(
+        "--disallow", action="append", default=[], metavar="PATH", help="Disallow в robots.txt (можно несколько)"
+    )
+    parser.add_argument("--compress", action="store_true", help="сжимать HTML по Accept-Encoding клиента")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальное зеркало books.toscrape.com")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    add_catalog_arguments(parser)
+    args = parser.parse_args()
+    catalog = Catalog(args.categories, args.books_per_category, args.seed, args.drift)
+    app = create_app(
+        catalog,
+        args.latency,
+        args.latency_jitter,
+        args.error_rate,
+        args.seed,
+        args.rate_limit,
+        args.crawl_delay,
+        args.disallow,
+        args.compress,
+    )
+    print(f"Зеркало: http://{args.host}:{args.port}/ ({len(catalog.books)} книг)", flush=True)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+from bench.mirror import add_catalog_arguments
+from bench.run import parse_env, run_parser, start_mirror
+from crawler.diff import iter_snapshot
+from crawler.records import json_default
+
+# Сверка записей: оба парсера работают на одном движке и должны выгружать одно и то же.
+# Порядок строк не сравнивается (он зависит от параллелизма), только набор записей
+OUTPUTS = {
+    "async": os.path.join("data", "async", "labirint_*_async.jsonl"),
+    "sync": os.path.join("data", "sync", "books_*.jsonl"),
+}
+
+
+def load_records(workdir, name):
+    paths = [
+        p for p in glob.glob(os.path.join(workdir, OUTPUTS[name])) if not p.endswith(".changes.jsonl")
+    ]
+    if len(paths) != 1:
+        raise RuntimeError(f"[{name}] ожидался один снимок, найдено: {paths}")
+    return Counter(
+        json.dumps(record.to_dict(), sort_keys=True, ensure_ascii=False, default=json_default)
+        for record in iter_snapshot(paths[0])
+    )
+
+
+def run_variant(label, name, base_url, extra_env):
+    with tempfile.TemporaryDirectory(prefix=f"parity_{label}_") as workdir:
+        result = run_parser(name, base_url, extra_env, workdir)
+        if "error" in result:
+            raise RuntimeError(f"[{label}] ошибка (код {result['exit_code']}): {result['error']}")
+        records = load_records(workdir, name)
+    print(f"[{label}] записей: {sum(records.values())}, время: {result['wall_seconds']:.2f} сек")
+    return records
+
+
+def compare(reference_label, reference, label, records, limit=5):
+    missing = reference - records
+    extra = records - reference
+    if not missing and not extra:
+        print(f"[{label}] совпадает с [{reference_label}]")
+        return True
+    print(f"[{label}] отличается от [{reference_label}]: нет {sum(missing.values())}, лишних {sum(extra.values())}")
+    for line in list(missing)[:limit]:
+        print(f"    - {line}")
+    for line in list(extra)[:limit]:
+        print(f"    + {line}")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сверка записей асинхронного и синхронного парсеров")
+    parser.add_argument(
+        "--sync-concurrency",
+        default="1,8",
+        help="с каким параллелизмом запускать синхронный парсер, через запятую",
+    )
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE", help="переменная окружения для парсеров"
+    )
+    add_catalog_arguments(parser)
+    args = parser.parse_args()
+    extra_env = parse_env(args.env)
+
+    mirror, base_url = start_mirror(args)
+    try:
+        reference = run_variant("async", "async", base_url, extra_env)
+        ok = True
+        for concurrency in (c.strip() for c in args.sync_concurrency.split(",") if c.strip()):
+            label = f"sync x{concurrency}"
+            records = run_variant(label, "sync", base_url, dict(extra_env, SYNC_CONCURRENCY=concurrency))
+            ok = compare("async", reference, label, records) and ok
+    finally:
+        mirror.terminate()
+        mirror.wait()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import argparse
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from bench.mirror import add_catalog_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARSERS = {
+    "async": os.path.join(ROOT, "async_parser_my.py"),
+    "sync": os.path.join(ROOT, "simple_parser_my.py"),
+}
+SNAPSHOT_RE = re.compile(r"Снимок метрик сохранен: (\S+)")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(url, proc, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Зеркало завершилось с кодом {proc.returncode}")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Зеркало не поднялось за {timeout} сек: {url}")
+
+
+def start_mirror(args):
+    port = free_port()
+    cmd = [
+        sys.executable, "-m", "bench.mirror",
+        "--port", str(port),
+        "--categories", str(args.categories),
+        "--books-per-category", str(args.books_per_category),
+        "--latency", str(args.latency),
+        "--latency-jitter", str(args.latency_jitter),
+        "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+        "--drift", str(args.drift),
+        "--rate-limit", str(args.rate_limit),
+        "--crawl-delay", str(args.crawl_delay),
+    ]
+    for path in args.disallow:
+        cmd += ["--disallow", path]
+    if args.compress:
+        cmd.append("--compress")
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/"
+    try:
+        wait_for_server(base_url, proc)
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    return proc, base_url
+
+
+# --- Квантили по бакетам гистограммы (как histogram_quantile в Prometheus) ---
+def histogram_buckets(families, name, labels=None):
+    # Одинаковые бакеты из нескольких снимков (координатор и воркеры) складываются
+    buckets = {}
+    for family in families:
+        for sample in family.samples:
+            if sample.name != f"{name}_bucket":
+                continue
+            sample_labels = dict(sample.labels)
+            le = float(sample_labels.pop("le"))
+            if labels and any(sample_labels.get(k) != v for k, v in labels.items()):
+                continue
+            buckets[le] = buckets.get(le, 0.0) + sample.value
+    return sorted(buckets.items())
+
+
+def histogram_quantile(q, buckets):
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    total = buckets[-1][1]
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def counter_value(families, name, labels=None):
+    total = 0.0
+    for family in families:
+        for sample in family.samples:
+            if sample.name != name:
+                continue
+            if labels and any(sample.labels.get(k) != v for k, v in labels.items()):
+                continue
+            total += sample.value
+    return total
+
+
+def summarize_metrics(snapshot_paths):
+    families = []
+    for path in snapshot_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            families.extend(text_string_to_metric_families(f.read()))
+    http = histogram_buckets(families, "http_request_duration_seconds")
+    parse = histogram_buckets(families, "parse_duration_seconds", {"page_type": "book"})
+    return {
+        "books_parsed": counter_value(families, "books_parsed_total"),
+        "http_requests": counter_value(families, "http_requests_total"),
+        "http_errors": counter_value(families, "http_request_errors_total"),
+        "http_p50": histogram_quantile(0.5, http),
+        "http_p99": histogram_quantile(0.99, http),
+        "bytes_wire": counter_value(families, "http_bytes_wire_total"),
+        "bytes_decoded": counter_value(families, "http_bytes_decoded_total"),
+        "parse_book_p50": histogram_quantile(0.5, parse),
+        "parse_book_p99": histogram_quantile(0.99, parse),
+    }
+
+
+# --- Один прогон парсера: время, пиковая память и CPU дочернего процесса ---
+def run_parser(name, base_url, extra_env, workdir):
+    env = dict(os.environ)
+    env.update({
+        "BASE_URL": base_url,
+        "PROM_PORT": str(free_port()),
+        "METRICS_TTL_SECONDS": "0",
+        "LOG_EACH_BOOK": "0",
+    })
+    env.update(extra_env)
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, PARSERS[name]],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    result = {
+        "parser": name,
+        "exit_code": proc.returncode,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(rusage.ru_utime + rusage.ru_stime, 3),
+        # ru_maxrss в Linux — килобайты
+        "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+    }
+    # В шардированном режиме снимок пишет каждый процесс: метрики суммируются
+    snapshots = SNAPSHOT_RE.findall(stderr)
+    if proc.returncode != 0 or not snapshots:
+        result["error"] = stderr.strip().splitlines()[-5:]
+        return result
+    result.update(summarize_metrics(snapshots))
+    result["books_per_second"] = round(result["books_parsed"] / wall, 2) if wall else None
+    return result
+
+
+def parse_env(pairs):
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--env ожидает KEY=VALUE, получено: {pair}")
+        env[key] = value
+    return env
+
+
+def format_seconds(value):
+    return "—" if value is None else f"{value * 1000:.1f} мс"
+
+
+def print_report(results):
+    for r in results:
+        if "error" in r:
+            print(f"[{r['parser']}] ошибка (код {r['exit_code']}):")
+            for line in r["error"]:
+                print(f"    {line}")
+            continue
+        print(
+            f"[{r['parser']}] книг={int(r['books_parsed'])} время={r['wall_seconds']:.2f} сек "
+            f"книг/сек={r['books_per_second']} CPU={r['cpu_seconds']:.2f} сек RSS={r['peak_rss_mb']} МБ"
+        )
+        print(
+            f"    HTTP p50={format_seconds(r['http_p50'])} p99={format_seconds(r['http_p99'])} "
+            f"запросов={int(r['http_requests'])} ошибок={int(r['http_errors'])}; "
+            f"разбор книги p50={format_seconds(r['parse_book_p50'])} p99={format_seconds(r['parse_book_p99'])}"
+        )
+        print(
+            f"    из сети={r['bytes_wire'] / 1e6:.2f} МБ, после распаковки={r['bytes_decoded'] / 1e6:.2f} МБ"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк парсеров на локальном зеркале")
+    parser.add_argument(
+        "--parsers", default="async,sync", help="какие парсеры запускать: async, sync или оба через запятую"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз прогнать каждый парсер")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE", help="переменная окружения для парсеров"
+    )
+    parser.add_argument("--output", help="куда сохранить JSON с результатами")
+    add_catalog_arguments(parser)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.parsers.split(",") if n.strip()]
+    unknown = [n for n in names if n not in PARSERS]
+    if unknown:
+        raise SystemExit(f"Неизвестные парсеры: {', '.join(unknown)}")
+    extra_env = parse_env(args.env)
+
+    mirror, base_url = start_mirror(args)
+    results = []
+    try:
+        for name in names:
+            for _ in range(args.repeat):
+                # Отдельный cwd на прогон: без кэша, чекпоинтов и индекса от прошлых запусков
+                with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as workdir:
+                    results.append(run_parser(name, base_url, extra_env, workdir))
+    finally:
+        mirror.terminate()
+        mirror.wait()
+
+    print_report(results)
+    output = args.output or os.path.join(
+        "data", "bench", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    report = {
+        "mirror": {
+            "categories": args.categories,
+            "books_per_category": args.books_per_category,
+            "latency": args.latency,
+            "latency_jitter": args.latency_jitter,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+            "drift": args.drift,
+            "rate_limit": args.rate_limit,
+            "crawl_delay": args.crawl_delay,
+            "disallow": args.disallow,
+            "compress": args.compress,
+        },
+        "env": extra_env,
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(f"Результаты сохранены: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Общий код синхронного и асинхронного парсеров books.toscrape.com
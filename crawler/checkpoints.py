@@ -0,0 +1,105 @@
+import sqlite3
+
+# --- Чекпойнт обхода в SQLite: фронтир категорий и книг + отметки о готовности ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS categories (
+    url TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS books (
+    url TEXT PRIMARY KEY,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class CrawlCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        # Готовые книги, чьи записи еще не сброшены на диск
+        self.done_pending = []
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    def can_resume(self):
+        # Есть что продолжать: прошлый запуск успел найти категории и не завершился
+        if self.get_meta("finished") == "1":
+            return False
+        return self.conn.execute("SELECT 1 FROM categories LIMIT 1").fetchone() is not None
+
+    def reset(self, **meta):
+        self.conn.execute("DELETE FROM meta")
+        self.conn.execute("DELETE FROM categories")
+        self.conn.execute("DELETE FROM books")
+        for key, value in meta.items():
+            self.set_meta(key, value)
+        self.conn.commit()
+
+    def add_categories(self, categories):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO categories (url, name) VALUES (?, ?)",
+            [(url, name) for name, url in categories],
+        )
+        self.conn.commit()
+
+    def categories(self):
+        # -> [(название, url, обработана ли)], в порядке обнаружения
+        rows = self.conn.execute("SELECT name, url, done FROM categories ORDER BY rowid")
+        return [(name, url, bool(done)) for name, url, done in rows]
+
+    def add_book(self, url):
+        # Без commit: ссылка фиксируется вместе с ближайшим commit() или finish_category()
+        self.conn.execute("INSERT OR IGNORE INTO books (url) VALUES (?)", (url,))
+
+    def finish_category(self, url):
+        # Категория считается пройденной, только когда все ее ссылки уже в фронтире
+        self.conn.execute("UPDATE categories SET done = 1 WHERE url = ?", (url,))
+        self.conn.commit()
+
+    def book_urls(self):
+        return [row[0] for row in self.conn.execute("SELECT url FROM books ORDER BY rowid")]
+
+    def pending_books(self):
+        rows = self.conn.execute("SELECT url FROM books WHERE done = 0 ORDER BY rowid")
+        return [row[0] for row in rows]
+
+    def mark_book_done(self, url):
+        # Отметки копятся в памяти и пишутся в базу только в commit() после сброса
+        # файлов результатов: другие commit (например, finish_category) их не захватят
+        self.done_pending.append(url)
+
+    def commit(self, offsets=None):
+        # Вместе с отметками запоминаем размеры файлов результатов на момент сброса
+        self.conn.executemany(
+            "UPDATE books SET done = 1 WHERE url = ?", [(u,) for u in self.done_pending]
+        )
+        self.done_pending = []
+        for path, offset in (offsets or {}).items():
+            self.set_meta("offset:" + path, offset)
+        self.conn.commit()
+
+    def offsets(self):
+        rows = self.conn.execute("SELECT key, value FROM meta WHERE key LIKE 'offset:%'")
+        return {key[len("offset:"):]: int(value) for key, value in rows}
+
+    def mark_finished(self):
+        self.set_meta("finished", 1)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
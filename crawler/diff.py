@@ -0,0 +1,162 @@
+import argparse
+import glob
+import json
+import os
+import sys
+
+from prometheus_client import Counter
+
+from crawler.records import BookRecord, json_default
+from crawler.writers import StreamWriter
+
+snapshot_changes_total = Counter(
+    "snapshot_changes_total", "Изменения относительно прошлого снимка", ["site", "change_type"]
+)
+snapshot_field_changes_total = Counter(
+    "snapshot_field_changes_total", "Измененные поля книг относительно прошлого снимка", ["site", "field"]
+)
+
+# Что сравниваем у книги с тем же UPC: цены, наличие и отзывы
+TRACKED_FIELDS = (
+    "price_excl_tax",
+    "price_inc_tax",
+    "tax",
+    "availability",
+    "stock",
+    "num_reviews",
+)
+
+CHANGES_SUFFIX = ".changes"
+
+# --- Чтение снимков: .jsonl построчно или .json-массив ---
+def iter_snapshot(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield BookRecord.from_json(line)
+        else:
+            for data in json.load(f):
+                yield BookRecord.from_dict(data)
+
+
+def load_index(path):
+    # UPC -> (название, значения TRACKED_FIELDS): только то, что нужно для сравнения
+    index = {}
+    for record in iter_snapshot(path):
+        if record.upc:
+            index[record.upc] = (record.title, tuple(record[f] for f in TRACKED_FIELDS))
+    return index
+
+
+def previous_snapshot_from_env(output_dir, pattern, exclude=None):
+    # DIFF_PREVIOUS: пусто — без сравнения, auto — последний снимок в каталоге, иначе путь
+    value = os.getenv("DIFF_PREVIOUS", "")
+    if value == "auto":
+        return latest_snapshot(output_dir, pattern, exclude)
+    return value or None
+
+
+def latest_snapshot(output_dir, pattern, exclude=None):
+    # Самый свежий снимок каталога (время — в имени файла), кроме текущего запуска;
+    # если есть и .json, и .jsonl, берем .jsonl
+    snapshots = {}
+    for ext in (".json", ".jsonl"):
+        for path in glob.glob(os.path.join(output_dir, pattern + ext)):
+            base = path[: -len(ext)]
+            # Журналы изменений (<снимок>.changes.jsonl) — не снимки
+            if base != exclude and not base.endswith(CHANGES_SUFFIX):
+                snapshots[base] = path
+    return snapshots[max(snapshots)] if snapshots else None
+
+# --- Журнал изменений: пишется по мере обхода, рядом с CSV / JSON Lines ---
+class ChangeLogWriter(StreamWriter):
+    def __init__(self, path, previous, offset=None, site=""):
+        # previous — индекс load_index() прошлого снимка, site — метка метрик
+        super().__init__(path, offset=offset)
+        self.previous = previous
+        self.site = site
+        self.counts = {"added": 0, "removed": 0, "changed": 0}
+
+    def emit(self, change_type, upc, title, **extra):
+        entry = {"type": change_type, "upc": upc, "title": title}
+        entry.update(extra)
+        self.file.write(json.dumps(entry, ensure_ascii=False, default=json_default))
+        self.file.write("\n")
+        self.counts[change_type] += 1
+        snapshot_changes_total.labels(site=self.site, change_type=change_type).inc()
+
+    def write(self, record):
+        # record — строка выгрузки (словарь полей); книги без UPC сравнить не с чем
+        upc = record.get("upc")
+        if not upc:
+            return
+        known = self.previous.get(upc)
+        if known is None:
+            self.emit(
+                "added",
+                upc,
+                record.get("title"),
+                **{f: record[f] for f in TRACKED_FIELDS if f in record},
+            )
+            return
+        _, old_values = known
+        changes = {}
+        for field, old in zip(TRACKED_FIELDS, old_values):
+            if field in record and record[field] != old:
+                changes[field] = [old, record[field]]
+                snapshot_field_changes_total.labels(site=self.site, field=field).inc()
+        if changes:
+            self.emit("changed", upc, record.get("title"), changes=changes)
+
+    def write_removed(self, current_path):
+        # Пропавшие книги — те, чьих UPC нет в текущем снимке. Снимок читается с диска
+        # целиком, поэтому это верно и после --resume (часть записей — из прошлого процесса)
+        seen = {record.upc for record in iter_snapshot(current_path)}
+        for upc, (title, _) in self.previous.items():
+            if upc not in seen:
+                self.emit("removed", upc, title)
+        return self.counts
+
+
+def open_change_log(base_path, previous_path, fields, offsets=None, site=""):
+    # Журнал <base_path>.changes.jsonl для дозаписи в RecordWriters; None — сравнивать нечем:
+    # без UPC (FIELDS без upc или CRAWL_MODE=listing) книги не сопоставить
+    if not previous_path or "upc" not in fields or os.getenv("CRAWL_MODE", "full") == "listing":
+        return None
+    path = base_path + CHANGES_SUFFIX + ".jsonl"
+    offset = offsets.get(path, 0) if offsets is not None else None
+    return ChangeLogWriter(path, load_index(previous_path), offset=offset, site=site)
+
+
+def diff_snapshots(old_path, new_path, output_path):
+    previous = load_index(old_path)
+    log = ChangeLogWriter(output_path, previous)
+    try:
+        for record in iter_snapshot(new_path):
+            log.write(record.to_dict())
+        log.write_removed(new_path)
+    finally:
+        log.close()
+    return log.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Разница двух снимков книг по UPC")
+    parser.add_argument("old", help="прошлый снимок (.jsonl или .json)")
+    parser.add_argument("new", help="новый снимок (.jsonl или .json)")
+    parser.add_argument(
+        "-o", "--output", help="журнал изменений (по умолчанию <new>.changes.jsonl)"
+    )
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.new)[0] + ".changes.jsonl"
+    counts = diff_snapshots(args.old, args.new, output)
+    print(
+        f"Добавлено: {counts['added']}, удалено: {counts['removed']}, "
+        f"изменено: {counts['changed']}. Журнал: {output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
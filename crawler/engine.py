@@ -0,0 +1,658 @@
+import asyncio
+import contextlib
+import copy
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from prometheus_client import Counter, Gauge
+
+from crawler import tracing
+from crawler.diff import open_change_log, previous_snapshot_from_env
+from crawler.extractors import (
+    BOOK_FIELDS,
+    DETAIL_FIELDS,
+    build_listing_book,
+    get_extractor,
+    parse_duration,
+)
+from crawler.fetch import AsyncFetcher, HttpConfig
+from crawler.limiter import AdaptiveLimiter, limiter_from_env
+from crawler.listing_index import ListingIndex
+from crawler.page_cache import PageCache, content_digest
+from crawler.politeness import BudgetExceeded, RobotsDisallowed, politeness_from_env
+from crawler.profiles import register_profiles
+from crawler.records import BookRecord
+from crawler.service import service_from_env
+from crawler.writers import open_book_writers, write_json_snapshot, write_parquet_snapshot
+
+# Движок обхода — асинхронный и общий для обоих парсеров: async_parser_my.py (одиночный
+# режим, воркеры, сервис) и simple_parser_my.py (блокирующая обертка над ним).
+# Сайты и их селекторы описаны профилями (crawler.profiles), метрики обхода — с меткой site
+
+# --- Метрики Prometheus ---
+scrape_duration = Gauge("scrape_duration_seconds", "Общее время работы скрипта")
+categories_count = Gauge("categories_count", "Количество категорий", ["site"])
+books_found_total = Gauge("books_found_total", "Количество уникальных книг", ["site"])
+book_pages_skipped_total = Counter(
+    "book_pages_skipped_total", "Книг, записанных без скачивания страницы книги", ["site", "reason"]
+)
+time_to_first_book = Gauge(
+    "time_to_first_book_seconds", "Время от старта обхода до первой записанной книги", ["site"]
+)
+books_parsed_total = Counter("books_parsed_total", "Количество успешно распарсенных книг", ["site"])
+books_errors_total = Counter("books_errors_total", "Количество ошибок при парсинге книг", ["site"])
+category_books_count = Gauge("category_books_count", "Книг в категории", ["site", "category"])
+parse_queue_depth = Gauge("parse_queue_depth", "Страниц в очереди на разбор")
+parse_skipped_total = Counter(
+    "parse_skipped_total", "Страниц без изменений, разбор пропущен", ["site", "page_type"]
+)
+
+# --- Разбор HTML: функция верхнего уровня, чтобы ее можно было отдать в процесс-пул ---
+def timed_parse(backend, site, encoding, method, *args):
+    # Время меряем внутри воркера, чтобы в гистограмму не попадало ожидание в очереди пула;
+    # отдельно — сколько из него занял разбор HTML в дерево (остальное — извлечение полей).
+    # Профиль сайта передается по имени: процессы пула получают профили при старте
+    extractor = get_extractor(backend, site)
+    extractor.encoding = encoding
+    start = time.perf_counter()
+    result = getattr(extractor, method)(*args)
+    return result, time.perf_counter() - start, extractor.last_document_seconds
+
+# --- Стадия разбора: процесс-пул или разбор прямо в цикле событий ---
+class ParseStage:
+    def __init__(self, workers, backend, profiles):
+        self.workers = workers
+        self.backend = backend
+        # Сайт, страницы которого разбирает стадия (см. for_site)
+        self.profile = profiles[0]
+        register_profiles(profiles)
+        self.pool = (
+            ProcessPoolExecutor(
+                max_workers=workers, initializer=register_profiles, initargs=(profiles,)
+            )
+            if workers > 0
+            else None
+        )
+
+    def for_site(self, profile):
+        # Та же стадия (и тот же пул процессов) для страниц другого сайта
+        stage = copy.copy(self)
+        stage.profile = profile
+        return stage
+
+    @property
+    def parser_key(self):
+        # Ключ кэша разобранных результатов: тот же HTML иначе разбирают другой бэкенд
+        # и другие селекторы
+        return f"{self.backend}:{self.profile.name}:{self.profile.selectors_digest}"
+
+    async def run(self, page_type, method, page, *args):
+        # page — crawler.fetch.Page: в разбор уходят сырые байты и объявленная кодировка
+        parse_queue_depth.inc()
+        submitted = time.perf_counter()
+        try:
+            if self.pool is None:
+                result, elapsed, document = timed_parse(
+                    self.backend, self.profile.name, page.encoding, method, page.body, *args
+                )
+            else:
+                loop = asyncio.get_running_loop()
+                result, elapsed, document = await loop.run_in_executor(
+                    self.pool,
+                    timed_parse,
+                    self.backend,
+                    self.profile.name,
+                    page.encoding,
+                    method,
+                    page.body,
+                    *args,
+                )
+                tracing.observe("parse_queue", time.perf_counter() - submitted - elapsed)
+        finally:
+            parse_queue_depth.dec()
+        parse_duration.labels(page_type=page_type).observe(elapsed)
+        tracing.observe("parse", document)
+        tracing.observe("extract", elapsed - document)
+        return result
+
+    async def run_cached(self, cache, url, page_type, method, page, *args):
+        # Пропускаем разбор, если содержимое страницы не изменилось с прошлого запуска
+        if cache is None or not cache.skip_unchanged:
+            return await self.run(page_type, method, page, *args)
+        digest = content_digest(page.body)
+        result = cache.load_parsed(url, digest, self.parser_key)
+        if result is not None:
+            parse_skipped_total.labels(site=self.profile.name, page_type=page_type).inc()
+            return result
+        result = await self.run(page_type, method, page, *args)
+        cache.store_parsed(url, digest, self.parser_key, result)
+        return result
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# --- Блок: получить ссылки книг из одной категории ---
+async def get_category_book_links(fetcher, name, url, logger, parse_stage, enqueue_book=None):
+    book_urls = []
+    page_url = url
+
+    while True:
+        page = await fetcher.fetch(page_url)
+        items, next_href = await parse_stage.run_cached(
+            fetcher.cache, page_url, "category", "parse_listing_page", page
+        )
+        for summary in items:
+            book_url = urljoin(page_url, summary.pop("href"))
+            summary["category"] = name
+            book_urls.append(book_url)
+            # Ссылка (с данными из списка) сразу уходит воркерам книг,
+            # не дожидаясь конца категории
+            if enqueue_book is not None:
+                await enqueue_book(book_url, summary)
+
+        if not next_href:
+            break
+        page_url = urljoin(page_url, next_href)
+
+    logger.info("Категория '%s': %d книг", name, len(book_urls))
+    category_books_count.labels(site=fetcher.site, category=name).set(len(book_urls))
+    return book_urls
+
+# --- Блок: получить данные одной книги ---
+async def get_book_data(fetcher, book_url, parse_stage):
+    # Скачиваем HTML книги (при HTTP_EARLY_STOP=1 — до stop_marker профиля) и отдаем
+    # сырые байты на разбор; строки полей превращаются в типизированную запись
+    # (Decimal цены, целые остаток и отзывы)
+    page = await fetcher.fetch(book_url, until=parse_stage.profile.stop_marker)
+    raw = await parse_stage.run_cached(fetcher.cache, book_url, "book", "parse_book", page)
+    return BookRecord.from_dict(raw)
+
+# --- Блок: обработка страницы каталога (если понадобится) ---
+async def get_page_data(fetcher, page, base_url):
+    url = f"{base_url}catalogue/page-{page}.html"
+    page = await fetcher.fetch(url)
+    soup = BeautifulSoup(page.body, "html.parser", from_encoding=page.encoding)
+    # Здесь можно добавить логику для обработки данных страницы
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/144.0.0.0 Safari/537.36"
+}
+
+# --- Настройки обхода из окружения: общие для одиночного режима и воркеров ---
+def page_cache_from_env():
+    if os.getenv("HTTP_CACHE", "0") == "0":
+        return None
+    return PageCache(
+        os.getenv("HTTP_CACHE_DIR", os.path.join("data", "cache")),
+        skip_unchanged=os.getenv("SKIP_UNCHANGED", "0") != "0",
+    )
+
+
+def listing_index_path(site):
+    # У каждого сайта свой файл индекса: одна база SQLite на несколько сайтов одного цикла
+    # событий блокировала бы его — транзакция одного сайта держит запись до commit_every
+    root, ext = os.path.splitext(
+        os.getenv("LISTING_INDEX_PATH", os.path.join("data", "listing_index.sqlite3"))
+    )
+    return f"{root}_{site}{ext}"
+
+
+def crawl_mode_from_env(logger, fields, site, read_only=False):
+    # Режим обхода: full — страница каждой книги; listing — только страницы списков;
+    # hybrid — страница книги, только если нужны поля из нее и данные списка изменились
+    crawl_mode = os.getenv("CRAWL_MODE", "full")
+    if crawl_mode not in ("full", "listing", "hybrid"):
+        raise ValueError(f"Неизвестный CRAWL_MODE: {crawl_mode}")
+    need_detail = any(f in DETAIL_FIELDS for f in fields)
+    if crawl_mode == "listing" and need_detail:
+        logger.info(
+            "CRAWL_MODE=listing: поля %s останутся пустыми",
+            ", ".join(f for f in fields if f in DETAIL_FIELDS),
+        )
+    listing_index = None
+    if crawl_mode == "hybrid" and need_detail:
+        listing_index = ListingIndex(listing_index_path(site), read_only=read_only)
+    return crawl_mode, listing_index
+
+def open_fetcher(profile, concurrency=None):
+    # Один лимитер на все HTTP запросы сайта: и страницы категорий, и страницы книг.
+    # concurrency — постоянный параллелизм (синхронный парсер), иначе AIMD; граница
+    # concurrency профиля действует в обоих случаях
+    if concurrency:
+        limiter = fixed_limiter(min(concurrency, profile.concurrency or concurrency), profile.name)
+    else:
+        limiter = limiter_from_env(profile.name, profile.concurrency)
+    return AsyncFetcher(
+        HttpConfig.from_env(),
+        HEADERS,
+        page_cache_from_env(),
+        limiter,
+        politeness_from_env(profile.name),
+        site=profile.name,
+    )
+
+
+def fixed_limiter(concurrency, site):
+    # Постоянный параллелизм без AIMD: concurrency одновременных запросов
+    return AdaptiveLimiter(
+        concurrency, min_limit=concurrency, max_limit=concurrency, adaptive=False, site=site
+    )
+
+
+def parse_stage_from_env(profiles):
+    return ParseStage(int(os.getenv("PARSE_WORKERS", "0")), get_extractor().name, profiles)
+
+
+class SiteLogger(logging.LoggerAdapter):
+    # Обход нескольких сайтов в одном логе: префикс [сайт] и поле site в JSON-логе
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return f"[{self.extra['site']}] {msg}", kwargs
+
+
+@contextlib.asynccontextmanager
+async def open_sites(profiles, logger, concurrency=None):
+    # -> [(профиль, логгер, HTTP клиент, стадия разбора), ...]. Сессия, кэш, лимитер
+    # и вежливость — свои у каждого сайта; процесс-пул разбора — общий.
+    # Монитор задержки цикла событий работает только при TRACE_STAGES=1
+    async with contextlib.AsyncExitStack() as stack:
+        await stack.enter_async_context(tracing.LoopLagMonitor())
+        parse_stage = stack.enter_context(parse_stage_from_env(profiles))
+        sites = []
+        for profile in profiles:
+            fetcher = await stack.enter_async_context(open_fetcher(profile, concurrency))
+            site_logger = SiteLogger(logger, {"site": profile.name}) if len(profiles) > 1 else logger
+            sites.append((profile, site_logger, fetcher, parse_stage.for_site(profile)))
+        yield sites
+
+# --- Блок: запись книги по режиму обхода (страница книги, данные списка или индекс) ---
+async def resolve_book(fetcher, parse_stage, book_url, summary, crawl_mode, listing_index):
+    # Книги из чекпойнта приходят без данных списка — для них всегда страница книги
+    if summary is None or crawl_mode == "full":
+        return await get_book_data(fetcher, book_url, parse_stage)
+    if listing_index is None:
+        book_pages_skipped_total.labels(site=fetcher.site, reason="listing").inc()
+        return BookRecord.from_dict(build_listing_book(summary))
+    known = listing_index.lookup(book_url, summary)
+    if known is not None:
+        book_pages_skipped_total.labels(site=fetcher.site, reason="unchanged").inc()
+        return known
+    item = await get_book_data(fetcher, book_url, parse_stage)
+    listing_index.store(book_url, summary, item)
+    return item
+
+# --- Главная асинхронная функция ---
+async def gather_data(profile, logger, writer, checkpoint=None, fields=BOOK_FIELDS):
+    # Создаем HTTP клиент (сессия aiohttp с настроенным пулом соединений и повторами)
+    # и стадию разбора (процесс-пул при PARSE_WORKERS > 0) на один обход одного сайта
+    async with open_sites([profile], logger) as sites:
+        _, _, fetcher, parse_stage = sites[0]
+        return await crawl_books(
+            profile.base_url, logger, writer, fetcher, parse_stage, checkpoint, fields
+        )
+
+
+async def crawl_books(
+    base_url, logger, writer, fetcher, parse_stage, checkpoint=None, fields=BOOK_FIELDS
+):
+    # Один обход сайта на готовых ресурсах: в режиме сервиса сессия, кэш, лимитер
+    # и пул разбора переживают циклы, поэтому здесь они не создаются
+    site = fetcher.site
+    cache = fetcher.cache
+    limiter = fetcher.limiter
+    politeness = fetcher.politeness
+    if politeness is not None:
+        politeness.reset_budget()
+    crawl_mode, listing_index = crawl_mode_from_env(logger, fields, site)
+
+    t_start = time.time()
+
+    # 1-2) Категории: из чекпойнта прерванного запуска или с главной страницы
+    saved = checkpoint.categories() if checkpoint is not None else []
+    if saved:
+        categories = [(name, url) for name, url, _ in saved]
+        pending_categories = [(name, url) for name, url, done in saved if not done]
+        logger.info(
+            "Возобновление: категорий %d, не обработано %d",
+            len(categories),
+            len(pending_categories),
+        )
+    else:
+        page = await fetcher.fetch(base_url)
+        categories = await parse_stage.run_cached(
+            cache, base_url, "home", "parse_categories", page, base_url
+        )
+        pending_categories = categories
+        if checkpoint is not None:
+            checkpoint.add_categories(categories)
+    categories_count.labels(site=site).set(len(categories))
+
+    # 3) Конвейер: категории кладут ссылки в ограниченную очередь по мере обнаружения,
+    #    воркеры книг одновременно разбирают ее (ограничение запросов — в лимитере)
+    queue = asyncio.Queue(maxsize=int(os.getenv("BOOK_QUEUE_SIZE", "500")))
+    seen = set()
+    stats = {"parsed": 0, "errors": 0, "skipped": 0, "processed": 0, "incomplete": 0}
+    progress_step = int(os.getenv("LOG_PROGRESS_EVERY", "50"))
+    log_each_book = os.getenv("LOG_EACH_BOOK", "1") != "0"
+
+    async def enqueue_book(book_url, summary=None):
+        # Дубли (книга в нескольких категориях или уже известна чекпойнту) отбрасываем
+        if book_url in seen:
+            return
+        seen.add(book_url)
+        books_found_total.labels(site=site).set(len(seen))
+        if checkpoint is not None:
+            checkpoint.add_book(book_url)
+        await queue.put((book_url, summary))
+
+    async def crawl_category(name, url):
+        try:
+            await get_category_book_links(fetcher, name, url, logger, parse_stage, enqueue_book)
+        except (BudgetExceeded, RobotsDisallowed) as e:
+            # Категория остается незавершенной в чекпойнте: --resume дообойдет ее
+            logger.info("Категория '%s' не дообойдена: %s", name, e.reason)
+            stats["incomplete"] += 1
+            return
+        if checkpoint is not None:
+            checkpoint.finish_category(url)
+
+    async def book_worker():
+        while True:
+            entry = await queue.get()
+            try:
+                if entry is None:
+                    return
+                await process_book(*entry)
+            finally:
+                queue.task_done()
+
+    async def process_book(book_url, summary=None):
+        try:
+            item = await resolve_book(
+                fetcher, parse_stage, book_url, summary, crawl_mode, listing_index
+            )
+        except BudgetExceeded:
+            # Не ошибка: книга остается в чекпойнте незавершенной
+            stats["skipped"] += 1
+        except Exception as e:
+            logger.info("Ошибка при обработке книги: %s", e, extra={"url": book_url})
+            books_errors_total.labels(site=site).inc()
+            stats["errors"] += 1
+        else:
+            if stats["parsed"] == 0:
+                time_to_first_book.labels(site=site).set(time.time() - t_start)
+                logger.info("Первая книга через %.2f сек", time.time() - t_start)
+            # Запись уходит в CSV/JSON Lines сразу, без накопления в памяти.
+            # Отметка о книге фиксируется в чекпойнте вместе с ближайшим сбросом файлов
+            if checkpoint is not None:
+                checkpoint.mark_book_done(book_url)
+            with tracing.stage_timer("write"):
+                writer.write(item.to_dict(fields))
+            stats["parsed"] += 1
+            if log_each_book:
+                # Строка на книгу — кандидат на прореживание (LOG_SAMPLE_EVERY / LOG_SAMPLE_RATE)
+                logger.info(
+                    "Обработана книга: %s", item.title, extra={"sample": "book", "url": book_url}
+                )
+            books_parsed_total.labels(site=site).inc()
+        stats["processed"] += 1
+        if progress_step > 0 and stats["processed"] % progress_step == 0:
+            logger.info(
+                "Прогресс: %d книг обработано, найдено %d",
+                stats["processed"],
+                len(seen),
+            )
+
+    # Воркеров хватает на верхнюю границу лимитера, чтобы не ограничивать его рост
+    workers_count = int(os.getenv("BOOK_WORKERS", str(limiter.max_limit)))
+    workers = [asyncio.create_task(book_worker()) for _ in range(workers_count)]
+    try:
+        # Незавершенные книги прерванного запуска идут в очередь первыми
+        if checkpoint is not None:
+            seen.update(checkpoint.book_urls())
+            books_found_total.labels(site=site).set(len(seen))
+            pending_urls = checkpoint.pending_books()
+            if len(pending_urls) != len(seen):
+                logger.info(
+                    "Уже обработано книг: %d, осталось: %d",
+                    len(seen) - len(pending_urls),
+                    len(pending_urls),
+                )
+            for book_url in pending_urls:
+                await queue.put((book_url, None))
+
+        await asyncio.gather(
+            *(crawl_category(name, url) for name, url in pending_categories)
+        )
+        logger.info("Категории обработаны за %.2f сек", time.time() - t_start)
+
+        # Все ссылки найдены: по одному стоп-сигналу на воркера
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        if listing_index is not None:
+            listing_index.close()
+
+    logger.info(
+        "Книги обработаны за %.2f сек (лимит параллелизма в конце: %d)",
+        time.time() - t_start,
+        limiter.current_limit(),
+    )
+    exhausted = politeness.exhausted if politeness is not None else None
+    if exhausted:
+        logger.info(
+            "Бюджет обхода исчерпан (%s): страниц %d, байт %d, книг пропущено %d",
+            exhausted,
+            politeness.pages,
+            politeness.bytes,
+            stats["skipped"],
+        )
+    return {
+        "categories": len(categories),
+        "books_found": len(seen),
+        "books_parsed": stats["parsed"],
+        "books_errors": stats["errors"],
+        "books_skipped": stats["skipped"],
+        "categories_incomplete": stats["incomplete"],
+        "budget_exhausted": exhausted,
+    }
+
+# --- Файлы результатов: имена снимков, журнал изменений, итоговые JSON и Parquet ---
+def new_base_path(output_dir, name_format, cur_time=None):
+    # name_format — шаблон имени с {ts}: "labirint_{ts}_async", "books_{ts}"
+    cur_time = cur_time or datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(output_dir, name_format.format(ts=cur_time))
+
+
+def snapshot_pattern(name_format):
+    # Маска прошлых снимков того же парсера (для DIFF_PREVIOUS=auto)
+    return name_format.format(ts="*")
+
+
+def write_snapshots(base_path, fields, logger):
+    # Итоговый JSON-массив собирается из JSON Lines (можно отключить JSON_SNAPSHOT=0)
+    if os.getenv("JSON_SNAPSHOT", "1") != "0":
+        json_path = base_path + ".json"
+        write_json_snapshot(base_path + ".jsonl", json_path)
+        logger.info("JSON сохранен: %s", json_path)
+    # Колоночная выгрузка для аналитики (нужен pyarrow): PARQUET_SNAPSHOT=1
+    if os.getenv("PARQUET_SNAPSHOT", "0") != "0":
+        parquet_path = base_path + ".parquet"
+        write_parquet_snapshot(base_path + ".jsonl", parquet_path, fields)
+        logger.info("Parquet сохранен: %s", parquet_path)
+
+
+def attach_change_log(writer, base_path, previous_path, fields, logger, site, offsets=None):
+    # Журнал изменений относительно прошлого снимка (DIFF_PREVIOUS) пишется по ходу обхода
+    change_log = open_change_log(base_path, previous_path, fields, offsets, site)
+    if change_log is not None:
+        writer.add(change_log)
+        logger.info("Сравнение с прошлым снимком: %s", previous_path)
+    elif previous_path:
+        logger.info("Сравнение со снимком пропущено: без поля upc книги не сопоставить")
+    return change_log
+
+
+def incomplete_reason(stats):
+    # Почему снимок неполный: без части каталога или книг отсутствие книги не значит,
+    # что ее удалили
+    if stats.get("budget_exhausted"):
+        return f"обход остановлен бюджетом ({stats['budget_exhausted']})"
+    if stats.get("categories_incomplete"):
+        return f"не дообойдено категорий: {stats['categories_incomplete']}"
+    if stats.get("books_errors"):
+        # Книга, которую не удалось скачать или разобрать, не пропала с сайта
+        return f"не скачано книг: {stats['books_errors']}"
+    return None
+
+
+def finish_change_log(writer, change_log, base_path, logger, stats):
+    # Удаленные книги определяются по полному снимку, поэтому сначала сбрасываем файлы
+    writer.flush()
+    reason = incomplete_reason(stats)
+    if reason is not None:
+        # Записи removed пишет только полный обход (в т.ч. завершивший --resume)
+        counts = change_log.counts
+        logger.info(
+            "Изменения: добавлено %d, изменено %d; удаленные не определялись — %s (журнал: %s)",
+            counts["added"],
+            counts["changed"],
+            reason,
+            change_log.path,
+        )
+        return
+    counts = change_log.write_removed(base_path + ".jsonl")
+    logger.info(
+        "Изменения: добавлено %d, удалено %d, изменено %d (журнал: %s)",
+        counts["added"],
+        counts["removed"],
+        counts["changed"],
+        change_log.path,
+    )
+
+
+async def crawl_to_snapshot(base_url, logger, fetcher, parse_stage, output_dir, name_format, fields):
+    # Один обход без чекпойнта в новые файлы (и журнал изменений при DIFF_PREVIOUS)
+    base_path = new_base_path(output_dir, name_format)
+    previous_path = previous_snapshot_from_env(output_dir, snapshot_pattern(name_format), exclude=base_path)
+    with open_book_writers(base_path, fields) as writer:
+        change_log = attach_change_log(writer, base_path, previous_path, fields, logger, fetcher.site)
+        logger.info("Результаты пишутся в: %s", ", ".join(writer.paths))
+        stats = await crawl_books(base_url, logger, writer, fetcher, parse_stage, None, fields)
+        if change_log is not None:
+            finish_change_log(writer, change_log, base_path, logger, stats)
+    # Снимки собираются в потоке, чтобы в режиме сервиса /trigger и /status отвечали и в это время
+    await asyncio.to_thread(write_snapshots, base_path, fields, logger)
+    return base_path, stats
+
+
+def site_output_dir(output_dir, profile, profiles):
+    # Один сайт пишет в output_dir, как и раньше; несколько — каждый в свою подпапку
+    if len(profiles) == 1:
+        return output_dir
+    path = os.path.join(output_dir, profile.name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Итоги обхода сайта, которые складываются по всем сайтам
+SITE_STATS_KEYS = (
+    "categories",
+    "books_found",
+    "books_parsed",
+    "books_errors",
+    "books_skipped",
+    "categories_incomplete",
+)
+
+
+async def crawl_sites(sites, output_dir, name_format, fields):
+    # Сайты обходятся одновременно в одном цикле событий, у каждого свой лимитер.
+    # Ошибка одного сайта не прерывает остальные: их снимки все равно пишутся
+    profiles = [profile for profile, _, _, _ in sites]
+    results = await asyncio.gather(
+        *(
+            crawl_to_snapshot(
+                profile.base_url,
+                site_logger,
+                fetcher,
+                parse_stage,
+                site_output_dir(output_dir, profile, profiles),
+                name_format,
+                fields,
+            )
+            for profile, site_logger, fetcher, parse_stage in sites
+        ),
+        return_exceptions=True,
+    )
+    if len(sites) == 1:
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0][1]
+    per_site = {}
+    failed = []
+    for (profile, site_logger, _, _), result in zip(sites, results):
+        if not isinstance(result, BaseException):
+            per_site[profile.name] = result[1]
+            continue
+        if not isinstance(result, Exception):
+            raise result
+        site_logger.error("Обход сайта прерван: %s", result, exc_info=result)
+        failed.append(result)
+        per_site[profile.name] = {
+            **dict.fromkeys(SITE_STATS_KEYS, 0),
+            "budget_exhausted": None,
+            "error": str(result),
+        }
+    if len(failed) == len(sites):
+        # Не удалось ни одного сайта — обход (и цикл режима сервиса) считается упавшим
+        raise failed[0]
+    # Итоги по всем сайтам и отдельно по каждому (видны в /status режима сервиса)
+    stats = {key: sum(site_stats[key] for site_stats in per_site.values()) for key in SITE_STATS_KEYS}
+    stats["budget_exhausted"] = next(
+        (s["budget_exhausted"] for s in per_site.values() if s["budget_exhausted"]), None
+    )
+    stats["sites_failed"] = [name for name, s in per_site.items() if "error" in s]
+    stats["sites"] = per_site
+    return stats
+
+
+async def crawl_once(profiles, logger, output_dir, name_format, fields=BOOK_FIELDS, concurrency=None):
+    async with open_sites(profiles, logger, concurrency) as sites:
+        return await crawl_sites(sites, output_dir, name_format, fields)
+
+# --- Режим сервиса: обходы по расписанию в одном процессе на теплых ресурсах ---
+def reset_run_gauges():
+    # Счетчики (books_parsed_total и т.п.) копятся за все циклы — rate() по ним корректен;
+    # gauge одного обхода обнуляются, чтобы не показывать значения прошлого цикла
+    categories_count.clear()
+    books_found_total.clear()
+    time_to_first_book.clear()
+    category_books_count.clear()
+
+
+async def serve(profiles, logger, output_dir, name_format, fields=BOOK_FIELDS, concurrency=None):
+    # Сессии aiohttp (пул соединений, TLS), кэш страниц, лимитеры и процесс-пул разбора
+    # создаются один раз: следующий цикл не платит за холодный старт
+    async with open_sites(profiles, logger, concurrency) as sites:
+
+        async def run_cycle(cycle):
+            reset_run_gauges()
+            return await crawl_sites(sites, output_dir, name_format, fields)
+
+        await service_from_env(run_cycle, logger).run()
@@ -0,0 +1,309 @@
+import os
+import sys
+import time
+from urllib.parse import urljoin
+
+import soupsieve
+from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+from lxml.cssselect import CSSSelector
+from prometheus_client import Histogram
+
+from crawler.profiles import RAW_BOOK_FIELDS, get_profile
+
+parse_duration = Histogram("parse_duration_seconds", "Время разбора HTML страницы", ["page_type"])
+
+# Порядок полей записи книги (колонки CSV). stock экстракторы не возвращают:
+# остаток разбирается из availability в crawler.records.BookRecord
+BOOK_FIELDS = (
+    "title",
+    "category",
+    "upc",
+    "product_type",
+    "price_excl_tax",
+    "price_inc_tax",
+    "tax",
+    "availability",
+    "stock",
+    "num_reviews",
+)
+
+
+# Поля, которых нет на страницах списка книг: за ними нужно идти на страницу книги
+DETAIL_FIELDS = ("upc", "product_type", "price_excl_tax", "tax", "stock", "num_reviews")
+
+
+def selected_fields():
+    # FIELDS=title,price_inc_tax,... — какие поля нужны в выгрузке (по умолчанию все)
+    raw = os.getenv("FIELDS", "")
+    fields = tuple(f.strip() for f in raw.split(",") if f.strip()) or BOOK_FIELDS
+    unknown = [f for f in fields if f not in BOOK_FIELDS]
+    if unknown:
+        raise ValueError(f"Неизвестные поля в FIELDS: {', '.join(unknown)}")
+    return fields
+
+
+def build_book(title, category, info, info_fields, fields=None):
+    # Единая форма записи книги: оба бэкенда обязаны возвращать одинаковые словари.
+    # info — таблица характеристик (ключ -> значение), info_fields — какое поле записи
+    # брать из какого ключа, fields — поля, найденные по отдельным селекторам профиля
+    book = dict.fromkeys(RAW_BOOK_FIELDS)
+    book["title"] = title
+    book["category"] = category
+    for field, key in info_fields.items():
+        book[field] = info.get(key)
+    book.update(fields or {})
+    return book
+
+def build_listing_book(summary):
+    # Запись только по данным страницы списка (article.product_pod)
+    return {
+        "title": summary["title"],
+        "category": summary["category"],
+        "upc": None,
+        "product_type": None,
+        "price_excl_tax": None,
+        "price_inc_tax": summary["price"],
+        "tax": None,
+        "availability": summary["availability"],
+        "num_reviews": None,
+    }
+
+# --- Интерфейс извлечения полей: разбор страниц по селекторам профиля сайта ---
+class BookExtractor:
+    name = None
+    # Сколько занял разбор HTML в дерево в последнем вызове: остальное время
+    # метода — извлечение полей (стадии parse / extract в crawler.tracing)
+    last_document_seconds = 0.0
+    # Кодировка текущей страницы из Content-Type (ставит timed_parse перед вызовом);
+    # None — бэкенд определяет ее по содержимому сам
+    encoding = None
+
+    def __init__(self, profile):
+        # Селекторы профиля компилируются один раз: экземпляр один на процесс и сайт
+        self.profile = profile
+        categories, listing, book = profile.categories, profile.listing, profile.book
+        self.category_list = self.compile(categories["list"])
+        self.category_link = self.compile(categories["link"])
+        self.item = self.compile(listing["item"])
+        self.item_link = self.compile(listing["link"])
+        self.item_price = self.compile(listing["price"])
+        self.item_availability = self.compile(listing["availability"])
+        self.next_page = self.compile(listing["next"])
+        self.title = self.compile(book["title"])
+        self.breadcrumb = self.compile(book["category"])
+        self.info_row = self.compile(book["info_row"])
+        self.info_key = self.compile(book["info_key"])
+        self.info_value = self.compile(book["info_value"])
+        self.book_fields = {field: self.compile(sel) for field, sel in book["fields"].items()}
+
+    def document(self, body):
+        start = time.perf_counter()
+        doc = self.build_document(body)
+        self.last_document_seconds = time.perf_counter() - start
+        return doc
+
+    def build_document(self, body):
+        raise NotImplementedError
+
+    def compile_selector(self, selector):
+        raise NotImplementedError
+
+    def compile(self, selector):
+        # Пустой селектор в профиле — поля на сайте нет (select вернет пустой список)
+        return self.compile_selector(selector) if selector else None
+
+    def select(self, pattern, node):
+        # -> все совпадения pattern внутри node
+        raise NotImplementedError
+
+    def select_one(self, pattern, node):
+        # -> первое совпадение или None
+        raise NotImplementedError
+
+    def text(self, node):
+        # Текст узла без пробелов по краям каждого куска (как get_text(strip=True))
+        raise NotImplementedError
+
+    def first_text(self, pattern, node):
+        found = self.select_one(pattern, node)
+        return self.text(found) if found is not None else None
+
+    def next_href(self, doc):
+        link = self.select_one(self.next_page, doc)
+        return link.get("href") if link is not None else None
+
+    def parse_categories(self, body, base_url):
+        # -> [(название категории, абсолютный url), ...]
+        doc = self.document(body)
+        cat_list = self.select_one(self.category_list, doc)
+        if cat_list is None:
+            raise ValueError("На главной странице не найден список категорий")
+        return [
+            (self.text(a), urljoin(base_url, a.get("href")))
+            for a in self.select(self.category_link, cat_list)
+        ]
+
+    def parse_category_page(self, body):
+        # -> ([относительные ссылки на книги], href следующей страницы или None)
+        doc = self.document(body)
+        links = []
+        for item in self.select(self.item, doc):
+            link = self.select_one(self.item_link, item)
+            if link is not None:
+                links.append(link.get("href"))
+        return links, self.next_href(doc)
+
+    def parse_listing_page(self, body):
+        # -> ([{"href", "title", "price", "availability"}, ...], href следующей страницы или None)
+        doc = self.document(body)
+        items = []
+        for item in self.select(self.item, doc):
+            link = self.select_one(self.item_link, item)
+            if link is None:
+                continue
+            # Полное название — в атрибуте title, текст ссылки бывает обрезан ("...")
+            items.append({
+                "href": link.get("href"),
+                "title": link.get("title") or self.text(link),
+                "price": self.first_text(self.item_price, item),
+                "availability": self.first_text(self.item_availability, item),
+            })
+        return items, self.next_href(doc)
+
+    def parse_book(self, body):
+        # -> словарь книги (см. build_book)
+        doc = self.document(body)
+
+        # Таблица характеристик (Product Information)
+        info = {}
+        for row in self.select(self.info_row, doc):
+            key = self.first_text(self.info_key, row)
+            if key is not None:
+                info[key] = self.first_text(self.info_value, row)
+
+        title = self.first_text(self.title, doc)
+        if title is None:
+            raise ValueError("На странице книги не найдено название")
+        crumbs = self.select(self.breadcrumb, doc)
+        category = self.text(crumbs[-1]) if crumbs else None
+        fields = {field: self.first_text(pattern, doc) for field, pattern in self.book_fields.items()}
+        return build_book(title, category, info, self.profile.book["info_fields"], fields)
+
+# --- Бэкенд BeautifulSoup (html.parser), селекторы — скомпилированные soupsieve ---
+class SoupExtractor(BookExtractor):
+    name = "bs4"
+
+    def build_document(self, body):
+        return BeautifulSoup(body, "html.parser", from_encoding=self.encoding)
+
+    def compile_selector(self, selector):
+        return soupsieve.compile(selector)
+
+    def select(self, pattern, node):
+        return pattern.select(node) if pattern is not None else []
+
+    def select_one(self, pattern, node):
+        return pattern.select_one(node) if pattern is not None else None
+
+    def text(self, node):
+        return node.get_text(strip=True)
+
+# --- Бэкенд lxml: CSS-селекторы компилируются в XPath ---
+def node_text(node):
+    # Аналог get_text(strip=True) из BeautifulSoup
+    return "".join(part.strip() for part in node.itertext())
+
+
+class LxmlExtractor(BookExtractor):
+    name = "lxml"
+
+    def __init__(self, profile):
+        super().__init__(profile)
+        self.parsers = {}
+
+    def build_document(self, body):
+        if self.encoding is None:
+            return lxml_html.fromstring(body)
+        # Парсер с заданной кодировкой — один на кодировку
+        parser = self.parsers.get(self.encoding)
+        if parser is None:
+            parser = self.parsers[self.encoding] = lxml_html.HTMLParser(encoding=self.encoding)
+        return lxml_html.fromstring(body, parser=parser)
+
+    def compile_selector(self, selector):
+        return CSSSelector(selector)
+
+    def select(self, pattern, node):
+        return pattern(node) if pattern is not None else []
+
+    def select_one(self, pattern, node):
+        found = self.select(pattern, node)
+        return found[0] if found else None
+
+    def text(self, node):
+        return node_text(node)
+
+
+EXTRACTORS = {
+    SoupExtractor.name: SoupExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+_instances = {}
+
+
+def get_extractor(name=None, site=None):
+    # Бэкенд выбирается через PARSER_BACKEND; экземпляр один на процесс и сайт
+    # (профиль сайта — из реестра crawler.profiles, по умолчанию books.toscrape.com)
+    name = name or os.getenv("PARSER_BACKEND", "bs4")
+    if name not in EXTRACTORS:
+        raise ValueError(f"Неизвестный PARSER_BACKEND: {name} (доступны: {', '.join(EXTRACTORS)})")
+    profile = get_profile(site)
+    key = (name, profile.name)
+    if key not in _instances:
+        _instances[key] = EXTRACTORS[name](profile)
+    return _instances[key]
+
+# --- Сверка бэкендов на сохраненных страницах ---
+FIXTURE_BASE_URL = "https://books.toscrape.com/"
+
+
+def extract_fixture(extractor, path):
+    # Тип страницы определяется по префиксу имени файла: home_*, category_*, book_*
+    with open(path, "rb") as f:
+        body = f.read()
+    kind = os.path.basename(path).split("_", 1)[0].split(".", 1)[0]
+    if kind == "home":
+        return extractor.parse_categories(body, FIXTURE_BASE_URL)
+    if kind == "category":
+        return extractor.parse_category_page(body), extractor.parse_listing_page(body)
+    if kind == "book":
+        return extractor.parse_book(body)
+    raise ValueError(f"Не удалось определить тип страницы по имени файла: {path}")
+
+
+def compare_backends(paths):
+    mismatches = []
+    for path in paths:
+        results = {name: extract_fixture(get_extractor(name), path) for name in EXTRACTORS}
+        reference = results[SoupExtractor.name]
+        for name, result in results.items():
+            if result != reference:
+                mismatches.append((path, name, reference, result))
+    return mismatches
+
+
+def main():
+    fixtures_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+    paths = sys.argv[1:] or sorted(
+        os.path.join(fixtures_dir, name) for name in os.listdir(fixtures_dir) if name.endswith(".html")
+    )
+    mismatches = compare_backends(paths)
+    for path, name, reference, result in mismatches:
+        print(f"{path}: {name} расходится с bs4\n  bs4:   {reference}\n  {name}: {result}")
+    print(f"Проверено страниц: {len(paths)}, расхождений: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
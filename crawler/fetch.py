@@ -0,0 +1,339 @@
+import asyncio
+import codecs
+import os
+import random
+import time
+import zlib
+from collections import namedtuple
+
+import aiohttp
+from prometheus_client import Counter, Histogram
+
+from crawler import tracing
+
+# brotli — необязательная зависимость: без нее сервер просят только о gzip/deflate
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Метрики HTTP (общие для синхронного и асинхронного парсеров, site — профиль сайта) ---
+http_requests_total = Counter("http_requests_total", "Количество HTTP запросов", ["site"])
+http_request_errors_total = Counter(
+    "http_request_errors_total", "Количество ошибок HTTP", ["site", "reason"]
+)
+http_request_duration = Histogram("http_request_duration_seconds", "Время HTTP запросов", ["site"])
+http_attempts_total = Counter(
+    "http_attempts_total", "Попытки HTTP запросов по исходу", ["site", "outcome"]
+)
+http_cache_hits_total = Counter(
+    "http_cache_hits_total", "Ответов 304: тело взято из кэша страниц", ["site"]
+)
+http_cache_misses_total = Counter(
+    "http_cache_misses_total", "Страниц, скачанных заново при включенном кэше", ["site"]
+)
+http_bytes_wire_total = Counter(
+    "http_bytes_wire_total", "Байт тел ответов из сети (как пришли, до распаковки)", ["site", "encoding"]
+)
+http_bytes_decoded_total = Counter(
+    "http_bytes_decoded_total", "Байт тел ответов после распаковки (ушли на разбор)", ["site", "encoding"]
+)
+http_early_stop_total = Counter(
+    "http_early_stop_total", "Ответов, дочитанных только до нужной части страницы", ["site"]
+)
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+OK_STATUSES = {200, 304}
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+# Тело страницы (байты после распаковки) и кодировка из Content-Type: разборщику
+# не нужно угадывать кодировку по содержимому. None — сервер кодировку не объявил
+Page = namedtuple("Page", ["body", "encoding"])
+
+
+class FetchError(Exception):
+    def __init__(self, url, reason, status=None):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.reason = reason
+        self.status = status
+
+
+def status_reason(status):
+    if status == 429:
+        return "http_429"
+    if status >= 500:
+        return "http_5xx"
+    return "http_4xx"
+
+
+def declared_charset(resp):
+    # Кодировка из Content-Type, если Python ее знает (иначе пусть угадывает разборщик)
+    charset = resp.charset
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def is_zlib_header(data):
+    # Заголовок zlib: метод сжатия 8 (deflate) в младших битах первого байта,
+    # а первые два байта как число кратны 31
+    if data[0] & 0x0F != 8:
+        return False
+    return len(data) < 2 or (data[0] << 8 | data[1]) % 31 == 0
+
+
+class BodyDecoder:
+    # Распаковка тела по Content-Encoding кусками: сессия работает с auto_decompress=False,
+    # чтобы считать байты из сети и при раннем останове не распаковывать остаток
+    def __init__(self, content_encoding):
+        self.encoding = (content_encoding or "identity").strip().lower()
+        if self.encoding in ("gzip", "x-gzip"):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            # Бывает и zlib-обертка (по RFC), и «голый» deflate: какой — видно по первым
+            # байтам тела, поэтому распаковщик создается в feed
+            self.decompressor = None
+        elif self.encoding == "br" and brotli is not None:
+            self.decompressor = brotli.Decompressor()
+        elif self.encoding == "identity":
+            self.decompressor = None
+        else:
+            raise aiohttp.ClientPayloadError(f"Неподдерживаемый Content-Encoding: {self.encoding}")
+
+    def feed(self, chunk):
+        if self.encoding == "deflate" and self.decompressor is None and chunk:
+            self.decompressor = zlib.decompressobj(
+                zlib.MAX_WBITS if is_zlib_header(chunk) else -zlib.MAX_WBITS
+            )
+        if self.decompressor is None:
+            return chunk
+        try:
+            if self.encoding == "br":
+                return self.decompressor.process(chunk)
+            return self.decompressor.decompress(chunk)
+        except Exception as e:
+            raise aiohttp.ClientPayloadError(f"Не удалось распаковать тело ({self.encoding}): {e}") from e
+
+    def flush(self):
+        if self.decompressor is None or self.encoding == "br":
+            return b""
+        return self.decompressor.flush()
+
+# --- Настройки HTTP из переменных окружения ---
+class HttpConfig:
+    def __init__(
+        self,
+        limit=100,
+        limit_per_host=0,
+        keepalive=15.0,
+        dns_cache=300,
+        timeout_total=30.0,
+        timeout_connect=10.0,
+        timeout_read=15.0,
+        retries=3,
+        backoff_base=0.5,
+        backoff_max=10.0,
+        compression=True,
+        early_stop=False,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive = keepalive
+        self.dns_cache = dns_cache
+        self.timeout_total = timeout_total
+        self.timeout_connect = timeout_connect
+        self.timeout_read = timeout_read
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Просить у сервера сжатые ответы (gzip/deflate, br — если установлен brotli)
+        self.compression = compression
+        # Дочитывать страницу только до маркера нужной части (см. AsyncFetcher.fetch)
+        self.early_stop = early_stop
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            limit=int(os.getenv("HTTP_LIMIT", "100")),
+            limit_per_host=int(os.getenv("HTTP_LIMIT_PER_HOST", "0")),
+            keepalive=float(os.getenv("HTTP_KEEPALIVE_SECONDS", "15")),
+            dns_cache=int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300")),
+            timeout_total=float(os.getenv("HTTP_TIMEOUT_TOTAL", "30")),
+            timeout_connect=float(os.getenv("HTTP_TIMEOUT_CONNECT", "10")),
+            timeout_read=float(os.getenv("HTTP_TIMEOUT_READ", "15")),
+            retries=int(os.getenv("HTTP_RETRIES", "3")),
+            backoff_base=float(os.getenv("HTTP_BACKOFF_BASE", "0.5")),
+            backoff_max=float(os.getenv("HTTP_BACKOFF_MAX", "10")),
+            compression=os.getenv("HTTP_COMPRESSION", "1") != "0",
+            early_stop=os.getenv("HTTP_EARLY_STOP", "0") != "0",
+        )
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # Экспоненциальная задержка с полным джиттером; Retry-After сервера — нижняя граница
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+
+class NullSlot:
+    # Заглушка слота лимитера, когда лимитер не используется
+    status = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+# --- Асинхронный клиент: одна сессия aiohttp с настроенным пулом соединений ---
+class AsyncFetcher:
+    def __init__(self, config, headers=None, cache=None, limiter=None, politeness=None, site=""):
+        self.config = config
+        # Имя профиля сайта — метка site в метриках HTTP
+        self.site = site
+        self.headers = headers or {}
+        self.cache = cache
+        self.limiter = limiter
+        # crawler.politeness.Politeness: robots.txt, бюджет и темп запросов на хост
+        self.politeness = politeness
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.config.limit,
+            limit_per_host=self.config.limit_per_host,
+            ttl_dns_cache=self.config.dns_cache,
+            keepalive_timeout=self.config.keepalive,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=self.config.timeout_total,
+            connect=self.config.timeout_connect,
+            sock_read=self.config.timeout_read,
+        )
+        headers = dict(self.headers)
+        headers["Accept-Encoding"] = ACCEPT_ENCODING if self.config.compression else "identity"
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers=headers,
+            auto_decompress=False,
+            trace_configs=tracing.trace_configs(),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def fetch(self, url, until=None):
+        # -> Page(тело в bytes, объявленная кодировка); повторы с backoff на сетевых
+        # ошибках и RETRY_STATUSES. until — маркер (bytes) конца нужной части страницы:
+        # при HTTP_EARLY_STOP=1 чтение прекращается, как только он пришел
+        if self.politeness is not None:
+            await self.politeness.admit(self.session, url)
+        attempt = 0
+        while True:
+            # Очередь хоста — до слота лимитера, чтобы ожидание не занимало слот
+            if self.politeness is not None:
+                await self.politeness.wait_turn(url)
+            slot = self.limiter.slot() if self.limiter is not None else NullSlot()
+            retry_after = None
+            try:
+                async with slot:
+                    slot.status, page, retry_after = await self._attempt(url, until)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "connection"
+                status = None
+            else:
+                if slot.status in OK_STATUSES:
+                    http_attempts_total.labels(site=self.site, outcome="ok").inc()
+                    return page
+                reason = status_reason(slot.status)
+                status = slot.status
+            http_request_errors_total.labels(site=self.site, reason=reason).inc()
+            retryable = status is None or status in RETRY_STATUSES
+            if not retryable or attempt >= self.config.retries:
+                http_attempts_total.labels(site=self.site, outcome="failed").inc()
+                raise FetchError(url, reason, status)
+            http_attempts_total.labels(site=self.site, outcome="retry").inc()
+            await asyncio.sleep(self.config.backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def _attempt(self, url, until=None):
+        # Одна попытка, с условными заголовками при включенном кэше
+        start = time.time()
+        until = until if self.config.early_stop else None
+        meta = self.cache.load(url) if self.cache is not None else None
+        # Обрезанное тело из кэша годится только тому, кому тоже нужна лишь часть страницы
+        if meta is not None and meta.get("partial") and until is None:
+            meta = None
+        headers = self.cache.conditional_headers(meta) if meta is not None else None
+        try:
+            async with self.session.get(url, headers=headers) as resp:
+                if meta is not None and resp.status == 304:
+                    page = Page(self.cache.read_body(url), meta.get("charset"))
+                    http_cache_hits_total.labels(site=self.site).inc()
+                else:
+                    read_start = time.perf_counter()
+                    body, partial = await self._read_body(resp, until)
+                    tracing.observe("body_read", time.perf_counter() - read_start)
+                    page = Page(body, declared_charset(resp))
+                    if self.cache is not None:
+                        http_cache_misses_total.labels(site=self.site).inc()
+                        if resp.status == 200:
+                            self.cache.store(
+                                url,
+                                body,
+                                resp.headers.get("ETag"),
+                                resp.headers.get("Last-Modified"),
+                                charset=page.encoding,
+                                partial=partial,
+                            )
+                if resp.status in OK_STATUSES:
+                    http_requests_total.labels(site=self.site).inc()
+                return resp.status, page, resp.headers.get("Retry-After")
+        finally:
+            http_request_duration.labels(site=self.site).observe(time.time() - start)
+
+    async def _read_body(self, resp, until=None):
+        # -> (распакованное тело, оборвано ли чтение на маркере until).
+        # Без until тело читается целиком одним read(); с until — кусками, и после маркера
+        # соединение закрывается, а не возвращается в пул (остаток ответа не дочитан)
+        decoder = BodyDecoder(resp.headers.get("Content-Encoding"))
+        if until is None:
+            raw = await resp.read()
+            self._count_bytes(decoder.encoding, len(raw))
+            body = decoder.feed(raw) + decoder.flush()
+            http_bytes_decoded_total.labels(site=self.site, encoding=decoder.encoding).inc(len(body))
+            return body, False
+        buf = bytearray()
+        wire = 0
+        partial = False
+        async for chunk in resp.content.iter_any():
+            wire += len(chunk)
+            searched = max(0, len(buf) - len(until) + 1)
+            buf += decoder.feed(chunk)
+            if buf.find(until, searched) != -1:
+                partial = True
+                http_early_stop_total.labels(site=self.site).inc()
+                break
+        else:
+            buf += decoder.flush()
+        self._count_bytes(decoder.encoding, wire)
+        http_bytes_decoded_total.labels(site=self.site, encoding=decoder.encoding).inc(len(buf))
+        return bytes(buf), partial
+
+    def _count_bytes(self, encoding, wire):
+        http_bytes_wire_total.labels(site=self.site, encoding=encoding).inc(wire)
+        # Бюджет обхода считает байты из сети, а не распакованные
+        if self.politeness is not None:
+            self.politeness.record_bytes(wire)
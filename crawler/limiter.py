@@ -0,0 +1,143 @@
+import asyncio
+import collections
+import os
+import time
+
+from prometheus_client import Gauge
+
+from crawler import tracing
+
+concurrency_limit = Gauge("concurrency_limit", "Текущий лимит одновременных HTTP запросов", ["site"])
+http_in_flight = Gauge("http_in_flight", "HTTP запросов в работе", ["site"])
+
+# Ответы, при которых сервер явно просит снизить нагрузку
+CONGESTION_STATUSES = {429}
+
+# --- AIMD-лимитер: аддитивный рост при здоровой латентности, мультипликативный спад при перегрузке ---
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial,
+        min_limit=1,
+        max_limit=100,
+        adaptive=True,
+        increase=1.0,
+        decrease=0.5,
+        latency_tolerance=2.0,
+        cooldown=1.0,
+        site="",
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.adaptive = adaptive
+        self.increase = increase
+        self.decrease = decrease
+        # Латентность считается здоровой, пока не превышает лучшую наблюдаемую в latency_tolerance раз
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        # Лимитер — один на сайт: метрики с меткой site
+        self.limit_gauge = concurrency_limit.labels(site=site)
+        self.in_flight_gauge = http_in_flight.labels(site=site)
+        self.limit_gauge.set(int(self.limit))
+
+    def current_limit(self):
+        return int(self.limit)
+
+    async def acquire(self):
+        while self.in_flight >= self.current_limit():
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    # Нас уже разбудили — передаем освободившийся слот следующему
+                    self._wake()
+                raise
+        self.in_flight += 1
+        self.in_flight_gauge.set(self.in_flight)
+
+    def release(self):
+        self.in_flight -= 1
+        self.in_flight_gauge.set(self.in_flight)
+        self._wake()
+
+    def _wake(self):
+        free = self.current_limit() - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def on_success(self, latency):
+        if not self.adaptive:
+            return
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        if latency > self.best_latency * self.latency_tolerance:
+            return
+        # +increase за «окно» из limit успешных ответов, как в TCP congestion avoidance
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        self.limit_gauge.set(self.current_limit())
+        self._wake()
+
+    def on_congestion(self):
+        if not self.adaptive:
+            return
+        # Пачка ошибок от одной перегрузки снижает лимит один раз за cooldown
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.limit_gauge.set(self.current_limit())
+
+    def slot(self):
+        return LimiterSlot(self)
+
+
+class LimiterSlot:
+    # async with limiter.slot() as slot: ...; slot.status = resp.status
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.status = None
+        self.start = None
+
+    async def __aenter__(self):
+        wait_start = time.monotonic()
+        await self.limiter.acquire()
+        self.start = time.monotonic()
+        tracing.observe("queue_wait", self.start - wait_start)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.limiter.release()
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            return False
+        if exc_type is not None or self.status in CONGESTION_STATUSES or (
+            self.status is not None and self.status >= 500
+        ):
+            # Таймауты, сетевые ошибки, 429 и 5xx — сигнал перегрузки
+            self.limiter.on_congestion()
+        else:
+            self.limiter.on_success(time.monotonic() - self.start)
+        return False
+
+
+def limiter_from_env(site="", max_limit=0):
+    # max_limit — граница параллелизма из профиля сайта (0 — CONCURRENCY_MAX)
+    return AdaptiveLimiter(
+        initial=int(os.getenv("MAX_CONCURRENCY", "10")),
+        min_limit=int(os.getenv("CONCURRENCY_MIN", "1")),
+        max_limit=max_limit or int(os.getenv("CONCURRENCY_MAX", "100")),
+        adaptive=os.getenv("ADAPTIVE_CONCURRENCY", "1") != "0",
+        site=site,
+    )
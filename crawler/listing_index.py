@@ -0,0 +1,63 @@
+import json
+import os
+import sqlite3
+
+from crawler.records import BookRecord
+
+# --- Индекс прошлых запусков для гибридного режима: данные списка и полная запись книги ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    url TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+"""
+
+
+def summary_key(summary):
+    # Категория не сравнивается: одна книга может встречаться в нескольких категориях
+    return json.dumps(
+        [summary["title"], summary["price"], summary["availability"]], ensure_ascii=False
+    )
+
+
+class ListingIndex:
+    def __init__(self, path, commit_every=100, read_only=False):
+        # read_only — воркер шардированного обхода: индекс только читается (в WAL чтение
+        # не ждет писателя), новые записи в него вносит координатор после слияния
+        self.path = path
+        self.commit_every = commit_every
+        self.read_only = read_only
+        self.pending = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def lookup(self, url, summary):
+        # Полная запись прошлого запуска, если данные списка с тех пор не изменились
+        row = self.conn.execute(
+            "SELECT summary, record FROM books WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None or row[0] != summary_key(summary):
+            return None
+        return BookRecord.from_json(row[1])
+
+    def store(self, url, summary, record):
+        if self.read_only:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO books (url, summary, record) VALUES (?, ?, ?)",
+            (url, summary_key(summary), record.to_json()),
+        )
+        # Это кэш: после падения достаточно потерять не больше commit_every записей
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
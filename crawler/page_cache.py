@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+
+# Версия формата разобранных результатов: при изменении экстракторов увеличиваем,
+# чтобы старые записи кэша не подмешивались в новые выгрузки
+PARSED_FORMAT_VERSION = 1
+
+
+def content_digest(body):
+    return hashlib.sha1(body).hexdigest()
+
+# --- Дисковый кэш страниц: ключ — URL, хранит ETag/Last-Modified, тело и разобранный результат ---
+class PageCache:
+    def __init__(self, cache_dir, skip_unchanged=False):
+        self.cache_dir = cache_dir
+        self.skip_unchanged = skip_unchanged
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{suffix}")
+
+    def _write(self, path, data):
+        # Пишем через временный файл, чтобы оборванный запуск не оставил битую запись
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, url):
+        # Запись считается валидной, только если есть и метаданные, и тело
+        meta = self._read_json(self._path(url, "meta.json"))
+        if meta is None or not os.path.exists(self._path(url, "body")):
+            return None
+        return meta
+
+    def conditional_headers(self, meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def read_body(self, url):
+        with open(self._path(url, "body"), "rb") as f:
+            return f.read()
+
+    def store(self, url, body, etag, last_modified, charset=None, partial=False):
+        # charset — кодировка из Content-Type (на 304 ее не присылают);
+        # partial — тело дочитано только до нужной части страницы (HTTP_EARLY_STOP)
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "digest": content_digest(body),
+            "charset": charset,
+            "partial": partial,
+        }
+        self._write(self._path(url, "body"), body)
+        self._write(self._path(url, "meta.json"), json.dumps(meta).encode("utf-8"))
+
+    def load_parsed(self, url, digest, parser):
+        # parser — чем разобрано (бэкенд, профиль сайта, хеш его селекторов): результат
+        # другого бэкенда или старой версии профиля не годится
+        parsed = self._read_json(self._path(url, "parsed.json"))
+        if (
+            parsed is None
+            or parsed.get("digest") != digest
+            or parsed.get("version") != PARSED_FORMAT_VERSION
+            or parsed.get("parser") != parser
+        ):
+            return None
+        return parsed["result"]
+
+    def store_parsed(self, url, digest, parser, result):
+        parsed = {"digest": digest, "version": PARSED_FORMAT_VERSION, "parser": parser, "result": result}
+        self._write(
+            self._path(url, "parsed.json"),
+            json.dumps(parsed, ensure_ascii=False).encode("utf-8"),
+        )
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from prometheus_client import Counter, Gauge, Histogram
+
+from crawler.fetch import FetchError
+
+# --- Вежливый обход: темп запросов на хост, robots.txt и бюджет обхода ---
+politeness_wait = Histogram(
+    "politeness_wait_seconds",
+    "Ожидание очереди хоста перед запросом (темп запросов на хост)",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+politeness_blocked_total = Counter(
+    "politeness_blocked_total", "Страниц, не скачанных из-за robots.txt или бюджета", ["site", "reason"]
+)
+host_rate_limit = Gauge("host_rate_limit", "Действующий темп запросов к хосту, запросов/сек", ["host"])
+crawl_budget_used = Gauge("crawl_budget_used", "Израсходовано бюджета обхода", ["site", "resource"])
+
+
+class RobotsDisallowed(FetchError):
+    def __init__(self, url):
+        super().__init__(url, "robots")
+
+
+class BudgetExceeded(FetchError):
+    def __init__(self, url, resource):
+        super().__init__(url, f"budget_{resource}")
+        self.resource = resource
+
+
+def normalize_crawl_delay(lines):
+    # RobotFileParser понимает только целый Crawl-delay; дробный (0.5) переводим
+    # в эквивалентный Request-rate (1000 запросов за 500 сек), который он разбирает
+    result = []
+    for line in lines:
+        key, sep, value = line.partition(":")
+        if sep and key.strip().lower() == "crawl-delay" and not value.strip().isdigit():
+            try:
+                delay_ms = round(float(value.split("#")[0]) * 1000)
+            except ValueError:
+                delay_ms = 0
+            if delay_ms > 0:
+                line = f"Request-rate: 1000/{delay_ms}"
+        result.append(line)
+    return result
+
+
+class HostBucket:
+    # Ведро токенов одного хоста: rate запросов в секунду, запас до burst.
+    # Токен резервируется сразу (уходя в минус), так что ожидающие идут по очереди
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def reserve(self):
+        # -> сколько ждать до своего запроса
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class Politeness:
+    def __init__(
+        self,
+        host_rps=0.0,
+        burst=1.0,
+        robots=True,
+        user_agent="*",
+        robots_ttl=86400.0,
+        max_pages=0,
+        max_bytes=0,
+        site="",
+    ):
+        # host_rps = 0 — без ограничения темпа (кроме Crawl-delay из robots.txt);
+        # site — метка метрик: бюджет у каждого сайта свой
+        self.host_rps = host_rps
+        self.burst = burst
+        self.robots = robots
+        self.user_agent = user_agent
+        self.robots_ttl = robots_ttl
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.site = site
+        # Шардированный обход (share): общий бюджет в очереди задач и доля темпа хоста
+        self.shared_budget = None
+        self.rate_share = 1
+        self.buckets = {}
+        self.parsers = {}
+        self.pending_robots = {}
+        self.reset_budget()
+
+    def reset_budget(self):
+        # Бюджет — на один обход (в режиме сервиса — на цикл)
+        self.pages = 0
+        self.bytes = 0
+        self.exhausted = None
+        crawl_budget_used.labels(site=self.site, resource="pages").set(0)
+        crawl_budget_used.labels(site=self.site, resource="bytes").set(0)
+
+    def share(self, shared_budget, processes):
+        # Координатор и воркеры — отдельные процессы: бюджет считается в общей очереди
+        # задач (crawler.work_queue.WorkQueue), а темп хоста делится на processes процессов
+        self.shared_budget = shared_budget
+        self.rate_share = max(1, processes)
+        self.buckets.clear()
+
+    def budget_limited(self):
+        return bool(self.max_pages or self.max_bytes)
+
+    # --- Перед скачиванием страницы: robots.txt и бюджет ---
+    async def admit(self, session, url):
+        if self.robots:
+            parser = await self.robots_for(session, url)
+            if parser is not None and not parser.can_fetch(self.user_agent, url):
+                politeness_blocked_total.labels(site=self.site, reason="robots").inc()
+                raise RobotsDisallowed(url)
+        if self.shared_budget is not None and self.budget_limited():
+            # Проверка и списание страницы — одной транзакцией на все процессы обхода
+            exhausted, self.pages, self.bytes = self.shared_budget.take_page(
+                self.max_pages, self.max_bytes
+            )
+            if exhausted:
+                self.block(url, exhausted)
+        else:
+            if self.max_bytes and self.bytes >= self.max_bytes:
+                self.block(url, "bytes")
+            if self.max_pages and self.pages >= self.max_pages:
+                self.block(url, "pages")
+            self.pages += 1
+        crawl_budget_used.labels(site=self.site, resource="pages").set(self.pages)
+
+    def block(self, url, resource):
+        self.exhausted = self.exhausted or resource
+        politeness_blocked_total.labels(site=self.site, reason=f"budget_{resource}").inc()
+        raise BudgetExceeded(url, resource)
+
+    def record_bytes(self, size):
+        # Учитываются байты из сети; тело из кэша страниц (ответ 304) бюджет не тратит
+        self.bytes += size
+        if self.shared_budget is not None and self.budget_limited():
+            self.bytes = self.shared_budget.add_bytes(size)
+        crawl_budget_used.labels(site=self.site, resource="bytes").set(self.bytes)
+
+    # --- Перед каждой попыткой запроса: очередь хоста ---
+    async def wait_turn(self, url):
+        host = urlsplit(url).netloc
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            rate = self.host_rate(host)
+            if rate <= 0:
+                return
+            bucket = self.buckets[host] = HostBucket(rate, max(1.0, self.burst / self.rate_share))
+            host_rate_limit.labels(host=host).set(rate)
+        delay = bucket.reserve()
+        politeness_wait.observe(delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def host_rate(self, host):
+        # Самый строгий из HOST_RPS и Crawl-delay / Request-rate из robots.txt хоста
+        rates = [self.host_rps] if self.host_rps > 0 else []
+        entry = self.parsers.get(host)
+        if entry is not None:
+            parser = entry[1]
+            delay = parser.crawl_delay(self.user_agent)
+            if delay:
+                rates.append(1.0 / float(delay))
+            request_rate = parser.request_rate(self.user_agent)
+            if request_rate and request_rate.seconds:
+                rates.append(request_rate.requests / request_rate.seconds)
+        return min(rates) / self.rate_share if rates else 0.0
+
+    # --- robots.txt: скачивается один раз на хост и живет robots_ttl секунд ---
+    async def robots_for(self, session, url):
+        parts = urlsplit(url)
+        host = parts.netloc
+        entry = self.parsers.get(host)
+        if entry is not None and time.monotonic() - entry[0] < self.robots_ttl:
+            return entry[1]
+        # Одновременные запросы к новому хосту ждут одну загрузку robots.txt
+        task = self.pending_robots.get(host)
+        if task is None:
+            task = asyncio.ensure_future(
+                self.load_robots(session, host, f"{parts.scheme}://{host}/robots.txt")
+            )
+            self.pending_robots[host] = task
+        return await asyncio.shield(task)
+
+    async def load_robots(self, session, host, robots_url):
+        # 401/403 — обход запрещен; прочие 4xx — ограничений нет;
+        # 5xx и сетевые ошибки — тоже без ограничений (robots.txt будет перечитан через TTL)
+        parser = RobotFileParser(robots_url)
+        try:
+            await self.wait_turn(robots_url)
+            # Сессия не распаковывает ответы сама (auto_decompress=False) — просим без сжатия
+            async with session.get(robots_url, headers={"Accept-Encoding": "identity"}) as resp:
+                if resp.status == 200:
+                    text = await resp.text(errors="replace")
+                    parser.parse(normalize_crawl_delay(text.splitlines()))
+                elif resp.status in (401, 403):
+                    parser.disallow_all = True
+                else:
+                    parser.allow_all = True
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            parser.allow_all = True
+        finally:
+            self.pending_robots.pop(host, None)
+        self.parsers[host] = (time.monotonic(), parser)
+        # Темп хоста пересчитывается с учетом Crawl-delay
+        self.buckets.pop(host, None)
+        return parser
+
+
+def politeness_from_env(site=""):
+    return Politeness(
+        host_rps=float(os.getenv("HOST_RPS", "0")),
+        burst=float(os.getenv("HOST_BURST", "1")),
+        robots=os.getenv("ROBOTS_TXT", "1") != "0",
+        user_agent=os.getenv("ROBOTS_USER_AGENT", "*"),
+        robots_ttl=float(os.getenv("ROBOTS_TTL_SECONDS", "86400")),
+        max_pages=int(os.getenv("CRAWL_MAX_PAGES", "0")),
+        max_bytes=int(os.getenv("CRAWL_MAX_BYTES", "0")),
+        site=site,
+    )
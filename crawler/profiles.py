@@ -0,0 +1,161 @@
+import copy
+import hashlib
+import json
+import os
+
+# --- Профили сайтов: селекторы каталога, пагинации, ссылок и полей книги ---
+# Профиль — JSON или YAML (нужен pyyaml) с разделами categories / listing / book.
+# Чего нет в файле, берется из профиля books.toscrape.com (DEFAULT_PROFILE)
+DEFAULT_PROFILE = {
+    "name": "books_toscrape",
+    "base_url": "https://books.toscrape.com/",
+    # Верхняя граница параллелизма запросов к сайту (0 — CONCURRENCY_MAX)
+    "concurrency": 0,
+    "categories": {
+        # Главная страница: блок списка категорий и ссылки внутри него
+        "list": ".side_categories ul.nav.nav-list",
+        "link": "li ul li a",
+    },
+    "listing": {
+        # Страница категории: карточка книги, ссылка (полное название — в атрибуте title),
+        # цена и наличие из карточки, ссылка на следующую страницу
+        "item": "article.product_pod",
+        "link": "h3 a",
+        "price": "p.price_color",
+        "availability": "p.availability",
+        "next": "li.next a",
+    },
+    "book": {
+        "title": "div.product_main h1",
+        # Категория — последняя ссылка из совпавших (хлебные крошки)
+        "category": "ul.breadcrumb li a",
+        # Таблица характеристик: строка, ключ и значение; info_fields — какое поле записи
+        # берется из строки с каким ключом
+        "info_row": "table.table.table-striped tr",
+        "info_key": "th",
+        "info_value": "td",
+        "info_fields": {
+            "upc": "UPC",
+            "product_type": "Product Type",
+            "price_excl_tax": "Price (excl. tax)",
+            "price_inc_tax": "Price (incl. tax)",
+            "tax": "Tax",
+            "availability": "Availability",
+            "num_reviews": "Number of reviews",
+        },
+        # Поля записи по отдельному селектору (текст первого совпадения), если таблицы нет
+        "fields": {},
+        # После этого маркера полей книги нет: при HTTP_EARLY_STOP=1 дальше не читаем
+        "stop_marker": "</table>",
+    },
+}
+
+# Поля, которые экстракторы заполняют со страницы книги (stock разбирается из availability)
+RAW_BOOK_FIELDS = (
+    "title",
+    "category",
+    "upc",
+    "product_type",
+    "price_excl_tax",
+    "price_inc_tax",
+    "tax",
+    "availability",
+    "num_reviews",
+)
+
+
+class SiteProfile:
+    def __init__(self, name, base_url, concurrency=0, categories=None, listing=None, book=None):
+        self.name = name
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.categories = categories or {}
+        self.listing = listing or {}
+        self.book = book or {}
+        marker = self.book.get("stop_marker")
+        self.stop_marker = marker.encode("utf-8") if marker else None
+        # Хеш селекторов: по нему кэш разобранных результатов отличает правку профиля
+        selectors = json.dumps([self.categories, self.listing, self.book], sort_keys=True)
+        self.selectors_digest = hashlib.sha1(selectors.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def from_dict(cls, data, source="<dict>"):
+        # Разделы сливаются с профилем по умолчанию; неизвестные ключи — ошибка, а не
+        # молча пустое поле в выгрузке
+        merged = copy.deepcopy(DEFAULT_PROFILE)
+        for key, value in data.items():
+            if key not in merged:
+                raise ValueError(f"{source}: неизвестный ключ профиля: {key}")
+            if isinstance(merged[key], dict):
+                if not isinstance(value, dict):
+                    raise ValueError(f"{source}: раздел {key} должен быть словарем")
+                unknown = [k for k in value if k not in merged[key]]
+                if unknown:
+                    raise ValueError(f"{source}: неизвестные ключи в {key}: {', '.join(unknown)}")
+                merged[key].update(value)
+            else:
+                merged[key] = value
+        book = merged["book"]
+        for section in ("info_fields", "fields"):
+            unknown = [f for f in book[section] if f not in RAW_BOOK_FIELDS]
+            if unknown:
+                raise ValueError(f"{source}: неизвестные поля в book.{section}: {', '.join(unknown)}")
+        return cls(**merged)
+
+    def with_base_url(self, base_url):
+        profile = copy.copy(self)
+        profile.base_url = base_url
+        return profile
+
+
+def load_profile(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            # pyyaml — необязательная зависимость, нужна только для YAML-профилей
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("Для YAML-профилей нужен pyyaml: pip install pyyaml") from None
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: профиль должен быть словарем")
+    # Имя сайта — метка site в метриках и папка выгрузки, поэтому обязательно
+    if not data.get("name"):
+        raise ValueError(f"{path}: у профиля должно быть имя (name)")
+    return SiteProfile.from_dict(data, path)
+
+
+def profiles_from_env():
+    # SITE_PROFILES=profiles/a.json,profiles/b.yaml — какие сайты обходить (по умолчанию
+    # books.toscrape.com). BASE_URL заменяет адрес, если сайт один (зеркало, бенчмарк)
+    paths = [p.strip() for p in os.getenv("SITE_PROFILES", "").split(",") if p.strip()]
+    profiles = [load_profile(p) for p in paths] or [SiteProfile.from_dict({})]
+    names = [p.name for p in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена профилей в SITE_PROFILES повторяются: {', '.join(names)}")
+    base_url = os.getenv("BASE_URL")
+    if base_url and len(profiles) == 1:
+        profiles = [profiles[0].with_base_url(base_url)]
+    return profiles
+
+# --- Реестр профилей процесса: экстракторы находят профиль по имени сайта ---
+_registry = {}
+
+
+def register_profiles(profiles):
+    # Вызывается в главном процессе и при старте каждого процесса пула разбора, чтобы
+    # в задачу разбора уходило только имя сайта, а селекторы компилировались один раз
+    for profile in profiles:
+        _registry[profile.name] = profile
+
+
+def get_profile(name=None):
+    if name is None:
+        name = DEFAULT_PROFILE["name"]
+        if name not in _registry:
+            _registry[name] = SiteProfile.from_dict({})
+    if name not in _registry:
+        raise ValueError(f"Профиль сайта не зарегистрирован: {name}")
+    return _registry[name]
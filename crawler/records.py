@@ -0,0 +1,96 @@
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from crawler.extractors import BOOK_FIELDS
+
+# --- Типизированная запись книги: строки со страницы разбираются один раз ---
+PRICE_FIELDS = ("price_excl_tax", "price_inc_tax", "tax")
+STOCK_RE = re.compile(r"\((\d+) available\)")
+# Цены на сайте — с двумя знаками после точки: после JSON (0.0) масштаб восстанавливается (0.00)
+CENTS = Decimal("0.01")
+
+
+def parse_price(value):
+    # "£51.77" -> Decimal("51.77"); уже разобранные числа (из JSON) тоже принимаются
+    if value is None or value == "":
+        return None
+    if isinstance(value, Decimal):
+        return value.quantize(CENTS)
+    if isinstance(value, float):
+        # str() дает кратчайшее представление: 51.77, а не 51.7699999...
+        value = str(value)
+    try:
+        return Decimal(str(value).strip().lstrip("£$€").replace(",", "")).quantize(CENTS)
+    except InvalidOperation:
+        raise ValueError(f"Не удалось разобрать цену: {value!r}") from None
+
+
+def parse_int(value):
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def parse_stock(availability):
+    # "In stock (22 available)" -> 22, "Out of stock" -> 0,
+    # "In stock" без числа (страница списка) -> None: остаток неизвестен
+    if not availability:
+        return None
+    match = STOCK_RE.search(availability)
+    if match:
+        return int(match.group(1))
+    if availability.strip().lower().startswith("out of stock"):
+        return 0
+    return None
+
+
+def json_default(value):
+    # Decimal в JSON пишется числом: для цен с двумя знаками float точно сохраняет текст
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class BookRecord:
+    # __slots__ вместо словаря на каждую запись: меньше памяти и фиксированный набор полей
+    __slots__ = BOOK_FIELDS
+
+    def __init__(self, **values):
+        for field in BOOK_FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_dict(cls, data):
+        # Принимает и сырой словарь экстрактора ("£51.77", "In stock (22 available)"),
+        # и уже разобранную запись из JSON (51.77, "stock": 22)
+        values = {field: data.get(field) for field in BOOK_FIELDS}
+        for field in PRICE_FIELDS:
+            values[field] = parse_price(values[field])
+        values["num_reviews"] = parse_int(values["num_reviews"])
+        if "stock" in data:
+            values["stock"] = parse_int(data["stock"])
+        else:
+            values["stock"] = parse_stock(values["availability"])
+        return cls(**values)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def to_dict(self, fields=BOOK_FIELDS):
+        return {field: getattr(self, field) for field in fields}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=json_default)
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def __eq__(self, other):
+        if not isinstance(other, BookRecord):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"BookRecord(title={self.title!r}, upc={self.upc!r})"
@@ -0,0 +1,172 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest
+
+# Логи и снимки метрик пишутся в папки Logs и Metrics в корне проекта
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Метрики логирования: запись на диск/в терминал идет в отдельном потоке ---
+log_write_duration = Histogram(
+    "log_write_duration_seconds",
+    "Время записи одной строки лога обработчиком",
+    ["handler"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+log_queue_depth = Gauge("log_queue_depth", "Строк лога в очереди на запись")
+log_records_dropped_total = Counter(
+    "log_records_dropped_total", "Строк лога, отброшенных до записи", ["reason"]
+)
+
+# Стандартные атрибуты LogRecord: все остальное пришло через extra и попадает в JSON
+RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listeners = {}
+
+
+@atexit.register
+def stop_listeners():
+    # Остаток очереди дописывается при обычном завершении процесса
+    while _listeners:
+        _, listener = _listeners.popitem()
+        listener.stop()
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна строка — один JSON-объект: время, уровень, сообщение и поля из extra
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    # Записи с extra={"sample": "<ключ>"} (например, по одной на книгу) прореживаются:
+    # пишется каждая every-я и не больше rate в секунду на ключ; остальные — без ограничений
+    def __init__(self, every=1, rate=0.0):
+        super().__init__()
+        self.every = max(1, every)
+        self.rate = rate
+        self.counts = {}
+        self.buckets = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % self.every:
+            log_records_dropped_total.labels(reason="sampled").inc()
+            return False
+        if self.rate > 0:
+            # Ведро токенов на ключ: запас на секунду записей (но не меньше одной, иначе при
+            # rate < 1 токен не накопится никогда), пополнение rate в секунду
+            capacity = max(1.0, self.rate)
+            now = time.monotonic()
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                log_records_dropped_total.labels(reason="rate_limited").inc()
+                return False
+            self.buckets[key] = (tokens - 1, now)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Цикл событий не ждет запись: при переполненной очереди строка отбрасывается
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.labels(reason="queue_full").inc()
+
+
+class TimedQueueListener(QueueListener):
+    # Поток записи: для каждого обработчика меряем, сколько заняли диск или терминал
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if record.levelno < handler.level:
+                continue
+            start = time.perf_counter()
+            handler.handle(record)
+            log_write_duration.labels(handler=handler.name).observe(time.perf_counter() - start)
+
+
+def init_logging(run_label):
+    logs_dir = os.path.join(ROOT, "Logs")
+    os.makedirs(logs_dir, exist_ok=True)
+
+    counter_path = os.path.join(logs_dir, f"{run_label}.run_counter")
+    try:
+        with open(counter_path, "r", encoding="utf-8") as f:
+            run_number = int(f.read().strip())
+    except Exception:
+        run_number = 0
+    run_number += 1
+    with open(counter_path, "w", encoding="utf-8") as f:
+        f.write(str(run_number))
+
+    # LOG_FORMAT=json — файл лога в JSON Lines (консоль остается текстовой)
+    json_lines = os.getenv("LOG_FORMAT", "text") == "json"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    log_filename = f"{run_label}_{timestamp}_run{run_number}.{'jsonl' if json_lines else 'log'}"
+    log_path = os.path.join(logs_dir, log_filename)
+
+    logger = logging.getLogger(run_label)
+    logger.setLevel(logging.INFO)
+    logger.handlers = []
+    previous = _listeners.pop(run_label, None)
+    if previous is not None:
+        previous.stop()
+
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter() if json_lines else formatter)
+    file_handler.name = "file"
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    console_handler.name = "console"
+
+    # Вызов logger.info только кладет запись в очередь; файл и консоль пишет отдельный поток
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    log_queue_depth.set_function(log_queue.qsize)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(
+        SampleFilter(
+            every=int(os.getenv("LOG_SAMPLE_EVERY", "1")),
+            rate=float(os.getenv("LOG_SAMPLE_RATE", "0")),
+        )
+    )
+    logger.addHandler(queue_handler)
+    listener = TimedQueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _listeners[run_label] = listener
+
+    return logger, log_path, run_number
+
+
+def write_metrics_snapshot(run_label, run_number):
+    metrics_dir = os.path.join(ROOT, "Metrics")
+    os.makedirs(metrics_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    metrics_filename = f"{run_label}_{timestamp}_run{run_number}.prom"
+    metrics_path = os.path.join(metrics_dir, metrics_filename)
+    with open(metrics_path, "wb") as f:
+        f.write(generate_latest())
+    return metrics_path
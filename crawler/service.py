@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import signal
+import time
+
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram
+
+# --- Метрики циклов: счетчики книг копятся за все циклы, итоги цикла — в отдельных gauge ---
+crawl_cycles_total = Counter("crawl_cycles_total", "Циклов обхода в режиме сервиса", ["outcome"])
+crawl_cycle_duration = Histogram(
+    "crawl_cycle_duration_seconds",
+    "Длительность цикла обхода",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600),
+)
+crawl_cycle_running = Gauge("crawl_cycle_running", "Идет ли сейчас цикл обхода")
+crawl_cycle_number = Gauge("crawl_cycle_number", "Номер текущего (или последнего) цикла")
+crawl_last_cycle_books = Gauge(
+    "crawl_last_cycle_books", "Книги последнего завершенного цикла", ["result"]
+)
+crawl_last_success_timestamp = Gauge(
+    "crawl_last_success_timestamp_seconds", "Время окончания последнего успешного цикла (unix)"
+)
+
+
+class CrawlService:
+    # Долгоживущий процесс: цикл обхода раз в interval секунд или по POST /trigger.
+    # run_cycle(номер) — корутина одного обхода; теплые ресурсы (сессия, кэш, пул)
+    # она берет из замыкания и не пересоздает между циклами
+    def __init__(self, run_cycle, logger, interval, host="0.0.0.0", port=8080, run_on_start=True):
+        self.run_cycle = run_cycle
+        self.logger = logger
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.run_on_start = run_on_start
+        self.cycle = 0
+        self.running = False
+        self.stopping = False
+        self.trigger = asyncio.Event()
+        self.last = None
+        self.next_run = None
+
+    # --- HTTP: запуск цикла вне расписания и состояние сервиса ---
+    async def handle_trigger(self, request):
+        already = self.running or self.trigger.is_set()
+        self.trigger.set()
+        self.logger.info("Запрошен внеочередной цикл (%s)", request.remote)
+        return web.json_response({"queued": True, "running": self.running, "already_queued": already}, status=202)
+
+    async def handle_status(self, request):
+        return web.json_response(
+            {
+                "cycle": self.cycle,
+                "running": self.running,
+                "next_run": self.next_run,
+                "last": self.last,
+            },
+            dumps=lambda data: json.dumps(data, ensure_ascii=False),
+        )
+
+    def stop(self):
+        # Текущий цикл дорабатывает до конца (файлы результатов закрываются как обычно)
+        self.logger.info("Остановка сервиса после текущего цикла")
+        self.stopping = True
+        self.trigger.set()
+
+    async def wait_next(self):
+        # -> True, если пора запускать цикл (по расписанию или по триггеру)
+        if self.interval <= 0:
+            self.next_run = None
+            await self.trigger.wait()
+        else:
+            self.next_run = time.time() + self.interval
+            try:
+                await asyncio.wait_for(self.trigger.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+        self.trigger.clear()
+        return not self.stopping
+
+    async def run_once(self):
+        self.cycle += 1
+        self.running = True
+        crawl_cycle_running.set(1)
+        crawl_cycle_number.set(self.cycle)
+        started = time.time()
+        self.logger.info("Цикл %d: старт", self.cycle)
+        try:
+            stats = await self.run_cycle(self.cycle)
+        except Exception as e:
+            # Ошибка цикла не останавливает сервис: следующий цикл — по расписанию
+            self.logger.exception("Цикл %d: ошибка: %s", self.cycle, e)
+            crawl_cycles_total.labels(outcome="failed").inc()
+            self.last = {"cycle": self.cycle, "ok": False, "error": str(e), "started": started}
+        else:
+            duration = time.time() - started
+            crawl_cycles_total.labels(outcome="ok").inc()
+            crawl_cycle_duration.observe(duration)
+            crawl_last_success_timestamp.set(time.time())
+            for key in ("books_found", "books_parsed", "books_errors"):
+                crawl_last_cycle_books.labels(result=key[len("books_"):]).set(stats.get(key, 0))
+            self.last = {"cycle": self.cycle, "ok": True, "duration": round(duration, 2), "started": started, **stats}
+            self.logger.info("Цикл %d: готово за %.2f сек: %s", self.cycle, duration, stats)
+        finally:
+            self.running = False
+            crawl_cycle_running.set(0)
+
+    async def run(self):
+        app = web.Application()
+        app.router.add_post("/trigger", self.handle_trigger)
+        app.router.add_get("/status", self.handle_status)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        self.logger.info(
+            "Сервис запущен: интервал %s сек, триггер POST http://%s:%d/trigger",
+            self.interval,
+            self.host,
+            self.port,
+        )
+        try:
+            if self.run_on_start:
+                await self.run_once()
+            while not self.stopping and await self.wait_next():
+                await self.run_once()
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            await runner.cleanup()
+        self.logger.info("Сервис остановлен, циклов: %d", self.cycle)
+
+
+def service_from_env(run_cycle, logger):
+    return CrawlService(
+        run_cycle,
+        logger,
+        interval=float(os.getenv("SERVE_INTERVAL_SECONDS", "3600")),
+        host=os.getenv("SERVE_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVE_PORT", "8080")),
+        run_on_start=os.getenv("SERVE_RUN_ON_START", "1") != "0",
+    )
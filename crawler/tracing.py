@@ -0,0 +1,199 @@
+import asyncio
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from datetime import datetime
+
+import aiohttp
+from prometheus_client import Gauge, Histogram
+
+# --- Трассировка стадий (включается TRACE_STAGES=1): куда уходит время одной страницы ---
+# queue_wait  — ожидание слота лимитера параллелизма
+# connect     — установка нового соединения (переиспользованные из пула не считаются)
+# ttfb        — от отправки запроса (или готового соединения) до заголовков ответа
+# body_read   — чтение тела ответа
+# parse_queue — ожидание свободного процесса в пуле разбора (PARSE_WORKERS > 0)
+# parse       — разбор HTML в дерево
+# extract     — извлечение полей из дерева
+# write       — запись книги в файлы результатов
+
+stage_duration = Histogram(
+    "stage_duration_seconds",
+    "Время стадий обработки страницы",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "Задержка цикла событий: насколько позже положенного просыпается таймер",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+event_loop_lag_max = Gauge(
+    "event_loop_lag_max_seconds", "Максимальная задержка цикла событий за последний интервал"
+)
+
+ENABLED = os.getenv("TRACE_STAGES", "0") != "0"
+
+
+def observe(stage, seconds):
+    if ENABLED:
+        stage_duration.labels(stage=stage).observe(seconds)
+
+
+class stage_timer:
+    # with stage_timer("write"): ... — без TRACE_STAGES ничего не меряет
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            stage_duration.labels(stage=self.stage).observe(time.perf_counter() - self.start)
+        return False
+
+
+def trace_configs():
+    # Хуки aiohttp для connect и ttfb; без TRACE_STAGES сессия создается без них
+    if not ENABLED:
+        return []
+
+    async def on_request_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+        ctx.connected = None
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        ctx.connected = time.perf_counter()
+        stage_duration.labels(stage="connect").observe(ctx.connected - ctx.connect_start)
+
+    async def on_request_end(session, ctx, params):
+        stage_duration.labels(stage="ttfb").observe(
+            time.perf_counter() - (ctx.connected or ctx.start)
+        )
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_connection_create_start.append(on_connection_create_start)
+    config.on_connection_create_end.append(on_connection_create_end)
+    config.on_request_end.append(on_request_end)
+    return [config]
+
+# --- Задержка цикла событий: долгий синхронный код (разбор, запись) задерживает все корутины ---
+async def monitor_loop_lag(interval=0.1, report_every=5.0):
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    last_report = loop.time()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        event_loop_lag.observe(lag)
+        worst = max(worst, lag)
+        event_loop_lag_max.set(worst)
+        # Максимум — за скользящее окно report_every секунд, чтобы старые пики не висели вечно
+        if loop.time() - last_report >= report_every:
+            worst = 0.0
+            last_report = loop.time()
+
+
+class LoopLagMonitor:
+    # async with LoopLagMonitor(): ... — фоновая задача на время обхода при TRACE_STAGES=1
+    def __init__(self, interval=None):
+        self.interval = interval or float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+        self.task = None
+
+    async def __aenter__(self):
+        if ENABLED:
+            self.task = asyncio.create_task(monitor_loop_lag(self.interval))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        return False
+
+# --- Профиль запуска (--profile): cProfile (.prof) и стеки в формате flamegraph (.folded) ---
+class StackSampler(threading.Thread):
+    # Раз в interval снимает стек главного потока. Итог — «свернутые» стеки
+    # (как у py-spy --format raw): speedscope, flamegraph.pl, inferno читают их напрямую
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.target = threading.main_thread().ident
+        self.stacks = StackCounter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfiler:
+    def __init__(self, run_label, run_number, enabled=True):
+        self.run_label = run_label
+        self.run_number = run_number
+        self.enabled = enabled
+        self.profile = None
+        self.sampler = None
+        self.paths = []
+
+    def start(self):
+        if self.enabled:
+            self.sampler = StackSampler(float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005")))
+            self.sampler.start()
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        return self
+
+    def stop(self):
+        # -> пути к .prof и .folded (пусто, если профилирование выключено)
+        if self.profile is None:
+            return self.paths
+        self.profile.disable()
+        self.sampler.stop()
+        profiles_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Profiles")
+        os.makedirs(profiles_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(profiles_dir, f"{self.run_label}_{timestamp}_run{self.run_number}")
+        self.profile.dump_stats(base + ".prof")
+        self.sampler.write(base + ".folded")
+        self.profile = None
+        self.paths = [base + ".prof", base + ".folded"]
+        return self.paths
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+import time
+
+from crawler.records import BookRecord
+
+# --- Общая очередь задач в SQLite для шардированного обхода: координатор + воркеры ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    url TEXT PRIMARY KEY,
+    summary TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    leased_until REAL,
+    record TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+CREATE TABLE IF NOT EXISTS budget (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pages INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO budget (id) VALUES (1);
+"""
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=120.0, commit_every=50):
+        # Одну базу открывают координатор и все воркеры (каждый своим соединением)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.commit_every = commit_every
+        self.pending = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value))
+        )
+        self.conn.commit()
+
+    # --- Сторона координатора ---
+    def add_task(self, url, summary=None):
+        # Дубли (книга в нескольких категориях) отбрасывает первичный ключ
+        self.conn.execute(
+            "INSERT OR IGNORE INTO tasks (url, summary) VALUES (?, ?)",
+            (url, None if summary is None else json.dumps(summary, ensure_ascii=False)),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def finish_discovery(self):
+        # После этой отметки новых задач не будет: воркеры могут завершаться, когда очередь пуста
+        self.commit()
+        self.set_meta("discovery_done", 1)
+
+    def discovery_done(self):
+        return self.get_meta("discovery_done") == "1"
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        for status, count in self.conn.execute(
+            "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+        ):
+            counts[status] = count
+        return counts
+
+    def finished(self):
+        # После исчерпания бюджета свободные задачи так и остаются pending: обход окончен,
+        # когда воркеры вернули взятые в аренду
+        if not self.discovery_done():
+            return False
+        counts = self.counts()
+        if counts["leased"] > 0:
+            return False
+        return counts["pending"] == 0 or self.budget_exhausted() is not None
+
+    def results(self):
+        # -> (url, данные списка, запись) готовых задач в порядке обнаружения ссылок,
+        # без загрузки всей таблицы в память
+        rows = self.conn.execute(
+            "SELECT url, summary, record FROM tasks WHERE status = 'done' ORDER BY rowid"
+        )
+        for url, summary, record in rows:
+            yield url, None if summary is None else json.loads(summary), BookRecord.from_json(record)
+
+    # --- Общий бюджет обхода (CRAWL_MAX_PAGES / CRAWL_MAX_BYTES) координатора и воркеров ---
+    def take_page(self, max_pages, max_bytes):
+        # -> (исчерпанный ресурс или None, страниц, байт); страница списывается, только
+        # если бюджет не исчерпан. Незафиксированные задачи координатора — сначала на диск
+        if self.conn.in_transaction:
+            self.commit()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            pages, size = self.conn.execute("SELECT pages, bytes FROM budget").fetchone()
+            exhausted = None
+            if max_bytes and size >= max_bytes:
+                exhausted = "bytes"
+            elif max_pages and pages >= max_pages:
+                exhausted = "pages"
+            if exhausted is None:
+                pages += 1
+                self.conn.execute("UPDATE budget SET pages = ?", (pages,))
+            else:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('budget_exhausted', ?)",
+                    (exhausted,),
+                )
+        return exhausted, pages, size
+
+    def add_bytes(self, size):
+        with self.conn:
+            (total,) = self.conn.execute(
+                "UPDATE budget SET bytes = bytes + ? RETURNING bytes", (size,)
+            ).fetchone()
+        return total
+
+    def budget_exhausted(self):
+        return self.get_meta("budget_exhausted")
+
+    # --- Сторона воркера ---
+    def claim(self, worker, limit):
+        # Берем свободные задачи и задачи с истекшей арендой (воркер упал или завис)
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                """
+                UPDATE tasks SET status = 'leased', worker = ?, leased_until = ?
+                WHERE rowid IN (
+                    SELECT rowid FROM tasks
+                    WHERE status = 'pending' OR (status = 'leased' AND leased_until < ?)
+                    ORDER BY rowid LIMIT ?
+                )
+                RETURNING url, summary
+                """,
+                (worker, now + self.lease_seconds, now, limit),
+            ).fetchall()
+        return [(url, None if summary is None else json.loads(summary)) for url, summary in rows]
+
+    def complete(self, worker, results):
+        # results — [(url, BookRecord или None, ошибка или None)]; пишем одной транзакцией.
+        # Задачу, аренду которой уже перехватил другой воркер, не трогаем
+        with self.conn:
+            self.conn.executemany(
+                """
+                UPDATE tasks SET status = ?, record = ?, error = ?, leased_until = NULL
+                WHERE url = ? AND status = 'leased' AND worker = ?
+                """,
+                [
+                    (
+                        "done" if error is None else "failed",
+                        None if record is None else record.to_json(),
+                        error,
+                        url,
+                        worker,
+                    )
+                    for url, record, error in results
+                ],
+            )
+
+    def release(self, worker, urls):
+        # Задачи, на которые не хватило бюджета, возвращаются в очередь необработанными
+        with self.conn:
+            self.conn.executemany(
+                """
+                UPDATE tasks SET status = 'pending', worker = NULL, leased_until = NULL
+                WHERE url = ? AND status = 'leased' AND worker = ?
+                """,
+                [(url, worker) for url in urls],
+            )
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,187 @@
+import csv
+import json
+import os
+import textwrap
+import time
+
+from crawler.records import BookRecord, json_default
+
+# --- Потоковые писатели: запись по мере разбора ---
+class StreamWriter:
+    def __init__(self, path, offset=None):
+        # offset — дозапись после падения: файл обрезается до последнего
+        # зафиксированного размера, все, что дописано после него, отбрасывается
+        self.path = path
+        if offset is not None and os.path.exists(path):
+            with open(path, "rb+") as f:
+                f.truncate(offset)
+        self.file = open(path, "w" if offset is None else "a", newline="", encoding="utf-8")
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def flush(self):
+        self.file.flush()
+
+    def offset(self):
+        return self.file.tell()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class CsvStreamWriter(StreamWriter):
+    def __init__(self, path, fieldnames, offset=None):
+        super().__init__(path, offset=offset)
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+
+class JsonLinesWriter(StreamWriter):
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False, default=json_default))
+        self.file.write("\n")
+
+
+# --- Несколько форматов одновременно; сброс на диск каждые N записей / T секунд ---
+class RecordWriters:
+    def __init__(self, writers, flush_every=100, flush_interval=5.0):
+        self.writers = writers
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.flush_callbacks = []
+        self.count = 0
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    @property
+    def paths(self):
+        return [w.path for w in self.writers]
+
+    def add(self, writer):
+        # Дополнительный приемник записей (например, журнал изменений): сбрасывается
+        # и учитывается в offsets() вместе с остальными файлами
+        self.writers.append(writer)
+
+    def on_flush(self, callback):
+        # callback(offsets) вызывается после каждого сброса: все, что записано
+        # до этих смещений, уже на диске
+        self.flush_callbacks.append(callback)
+
+    def offsets(self):
+        return {w.path: w.offset() for w in self.writers}
+
+    def write(self, record):
+        for w in self.writers:
+            w.write(record)
+        self.count += 1
+        self.pending += 1
+        if (self.flush_every > 0 and self.pending >= self.flush_every) or (
+            time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        for w in self.writers:
+            w.flush()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        if self.flush_callbacks:
+            offsets = self.offsets()
+            for callback in self.flush_callbacks:
+                callback(offsets)
+
+    def close(self):
+        self.flush()
+        for w in self.writers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_book_writers(base_path, fieldnames, offsets=None):
+    # base_path без расширения: рядом появятся .csv и .jsonl;
+    # offsets — {путь: размер} для дозаписи в файлы прерванного запуска
+    csv_path = base_path + ".csv"
+    jsonl_path = base_path + ".jsonl"
+    if offsets is not None:
+        csv_offset, jsonl_offset = offsets.get(csv_path, 0), offsets.get(jsonl_path, 0)
+    else:
+        csv_offset = jsonl_offset = None
+    return RecordWriters(
+        [
+            CsvStreamWriter(csv_path, fieldnames, offset=csv_offset),
+            JsonLinesWriter(jsonl_path, offset=jsonl_offset),
+        ],
+        flush_every=int(os.getenv("FLUSH_EVERY", "100")),
+        flush_interval=float(os.getenv("FLUSH_INTERVAL_SECONDS", "5")),
+    )
+
+
+def write_json_snapshot(jsonl_path, json_path):
+    # Собираем привычный JSON-массив из JSON Lines построчно, не держа записи в памяти.
+    # Формат совпадает с json.dump(records, indent=4, ensure_ascii=False)
+    count = 0
+    with open(jsonl_path, "r", encoding="utf-8") as src, open(json_path, "w", encoding="utf-8") as dst:
+        dst.write("[")
+        for line in src:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            dst.write(",\n" if count else "\n")
+            dst.write(textwrap.indent(json.dumps(record, indent=4, ensure_ascii=False), "    "))
+            count += 1
+        dst.write("\n]" if count else "]")
+    return count
+
+
+def parquet_schema(fields):
+    # Колоночные типы: цены — decimal, остаток и отзывы — целые, без разбора строк при загрузке
+    import pyarrow as pa
+
+    types = {
+        "price_excl_tax": pa.decimal128(10, 2),
+        "price_inc_tax": pa.decimal128(10, 2),
+        "tax": pa.decimal128(10, 2),
+        "stock": pa.int32(),
+        "num_reviews": pa.int32(),
+    }
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+
+def write_parquet_snapshot(jsonl_path, parquet_path, fields, batch_size=10000):
+    # Parquet собирается из JSON Lines после обхода (как и JSON-массив): дозапись после
+    # --resume остается на стороне .jsonl, в памяти — не больше batch_size записей.
+    # pyarrow — необязательная зависимость, нужна только при PARQUET_SNAPSHOT=1
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для PARQUET_SNAPSHOT=1 нужен pyarrow: pip install pyarrow") from None
+
+    schema = parquet_schema(fields)
+    count = 0
+    with open(jsonl_path, "r", encoding="utf-8") as src, pq.ParquetWriter(parquet_path, schema) as dst:
+        columns = {field: [] for field in fields}
+        for line in src:
+            if not line.strip():
+                continue
+            record = BookRecord.from_json(line)
+            for field in fields:
+                columns[field].append(record[field])
+            count += 1
+            if count % batch_size == 0:
+                dst.write_table(pa.table(columns, schema=schema))
+                columns = {field: [] for field in fields}
+        if count == 0 or count % batch_size:
+            dst.write_table(pa.table(columns, schema=schema))
+    return count